@@ -18,6 +18,8 @@
 import os
 import math
 import logging
+from typing import Optional
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -29,6 +31,72 @@ from .file_utils import add_start_docstrings
 
 logger = logging.getLogger(__name__)
 
+# Fused attention kernel (FlashAttention / memory-efficient attention) is only
+# available on recent PyTorch; fall back to the materialized path otherwise.
+_HAS_SDPA = hasattr(F, "scaled_dot_product_attention")
+
+try:
+    from torch.cuda.amp import autocast as _amp_autocast
+except ImportError:
+    _amp_autocast = None
+
+try:
+    # TF32 matmuls are a free throughput win on Ampere for the fat-skinny
+    # classifier/QA head GEMMs; older torch builds do not expose the switches.
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+except AttributeError:
+    pass
+
+try:
+    # Single-kernel layer norm (mean/var/normalize/affine fused); parameter
+    # names and signature match torch.nn.LayerNorm so checkpoints load as-is.
+    from apex.normalization import FusedLayerNorm as AlbertLayerNorm
+except ImportError:
+    AlbertLayerNorm = torch.nn.LayerNorm
+
+
+@torch.jit.script
+def _residual_layer_norm(x: torch.Tensor, residual: torch.Tensor,
+                         weight: torch.Tensor, bias: torch.Tensor, eps: float) -> torch.Tensor:
+    """Residual add fused into the layer norm kernel by the JIT."""
+    return F.layer_norm(x + residual, [weight.size(0)], weight, bias, eps)
+
+
+@torch.jit.script
+def _fused_pool(cls_state: torch.Tensor, weight: torch.Tensor, bias: torch.Tensor) -> torch.Tensor:
+    """Pooler linear + tanh, fused by the JIT."""
+    return torch.tanh(F.linear(cls_state, weight, bias))
+
+
+def _ffn_tail(x, activation, ffn_w, ffn_b, ffn_out_w, ffn_out_b, ln_w, ln_b, eps):
+    """GEMM / activation / GEMM / residual / layer-norm tail of an AlbertLayer.
+
+    A free function over tensors rather than a bound method: one compiled
+    artifact serves every layer instance, and nothing callable lives on the
+    module, so DataParallel replication and deepcopy see only parameters.
+    """
+    h = F.linear(x, ffn_w, ffn_b)
+    h = activation(h)
+    h = F.linear(h, ffn_out_w, ffn_out_b)
+    return F.layer_norm(h + x, [ln_w.size(0)], ln_w, ln_b, eps)
+
+
+if hasattr(torch, "compile"):
+    _compiled_ffn_tail = torch.compile(_ffn_tail)
+else:
+    _compiled_ffn_tail = None
+
+
+@torch.jit.script
+def _clamp_positions(positions: torch.Tensor, ignored_index: int) -> torch.Tensor:
+    """Drop the extra multi-GPU dim and clamp out-of-range span targets onto
+    the ignore index, fused by the JIT. Only the upper bound is clamped:
+    positions are unsigned, so the old lower bound was a dead compare."""
+    if positions.dim() > 1:
+        positions = positions.squeeze(-1)
+    return positions.clamp(max=ignored_index)
+
 
 ALBERT_PRETRAINED_MODEL_ARCHIVE_MAP = {
     'albert-base-v1': "https://s3.amazonaws.com/models.huggingface.co/bert/albert-base-pytorch_model.bin",
@@ -42,6 +110,37 @@ ALBERT_PRETRAINED_MODEL_ARCHIVE_MAP = {
 }
 
 
+# TF variable name -> PyTorch module path rewrites, applied in order. The order
+# matters: several rules operate on the output of earlier ones.
+_TF_TO_PT_NAME_REPLACEMENTS = (
+    # If saved from the TF HUB module
+    ("module/", ""),
+    # Renaming and simplifying
+    ("ffn_1", "ffn"),
+    ("bert/", "albert/"),
+    ("attention_1", "attention"),
+    ("transform/", ""),
+    ("LayerNorm_1", "full_layer_layer_norm"),
+    ("LayerNorm", "attention/LayerNorm"),
+    ("transformer/", ""),
+    # The feed forward layer had an 'intermediate' step which has been abstracted away
+    ("intermediate/dense/", ""),
+    ("ffn/intermediate/output/dense/", "ffn_output/"),
+    # ALBERT attention was split between self and output which have been abstracted away
+    ("/output/", "/"),
+    ("/self/", "/"),
+    # The pooler is a linear layer
+    ("pooler/dense", "pooler"),
+    # The classifier was simplified to predictions from cls/predictions
+    ("cls/predictions", "predictions"),
+    ("predictions/attention", "predictions"),
+    # Naming was changed to be more explicit
+    ("embeddings/attention", "embeddings"),
+    ("inner_group_", "albert_layers/"),
+    ("group_", "albert_layer_groups/"),
+)
+
+
 def load_tf_weights_in_albert(model, config, tf_checkpoint_path):
     """ Load tf checkpoints in a pytorch model."""
     try:
@@ -64,60 +163,29 @@ def load_tf_weights_in_albert(model, config, tf_checkpoint_path):
         names.append(name)
         arrays.append(array)
 
-    for name, array in zip(names, arrays):
-        print(name)
-    
     for name, array in zip(names, arrays):
         original_name = name
 
-        # If saved from the TF HUB module
-        name = name.replace("module/", "")
-
-        # Renaming and simplifying
-        name = name.replace("ffn_1", "ffn")
-        name = name.replace("bert/", "albert/")
-        name = name.replace("attention_1", "attention")   
-        name = name.replace("transform/", "")
-        name = name.replace("LayerNorm_1", "full_layer_layer_norm")    
-        name = name.replace("LayerNorm", "attention/LayerNorm")   
-        name = name.replace("transformer/", "")
-
-        # The feed forward layer had an 'intermediate' step which has been abstracted away
-        name = name.replace("intermediate/dense/", "")
-        name = name.replace("ffn/intermediate/output/dense/", "ffn_output/")
-
-        # ALBERT attention was split between self and output which have been abstracted away
-        name = name.replace("/output/", "/")
-        name = name.replace("/self/", "/")
-
-        # The pooler is a linear layer
-        name = name.replace("pooler/dense", "pooler")
+        # Ignore the gradients applied by the LAMB/ADAM optimizers.
+        if "adam_m" in name or "adam_v" in name or "global_step" in name:
+            logger.info("Skipping {}".format(name))
+            continue
 
-        # The classifier was simplified to predictions from cls/predictions
-        name = name.replace("cls/predictions", "predictions")
-        name = name.replace("predictions/attention", "predictions")
+        # No ALBERT model currently handles the next sentence prediction task
+        if "seq_relationship" in name:
+            continue
 
-        # Naming was changed to be more explicit
-        name = name.replace("embeddings/attention", "embeddings")    
-        name = name.replace("inner_group_", "albert_layers/") 
-        name = name.replace("group_", "albert_layer_groups/")   
+        for old, new in _TF_TO_PT_NAME_REPLACEMENTS:
+            name = name.replace(old, new)
 
         # Classifier
         if len(name.split("/")) == 1 and ("output_bias" in name or "output_weights" in name):
             name = "classifier/" + name
 
-        # No ALBERT model currently handles the next sentence prediction task 
-        if "seq_relationship" in name:
-            continue
-
         name = name.split('/')
 
-        # Ignore the gradients applied by the LAMB/ADAM optimizers.
-        if "adam_m" in name or "adam_v" in name or "global_step" in name:
-            logger.info("Skipping {}".format("/".join(name)))
-            continue
-
         pointer = model
+        qkv_offset = None
         for m_name in name:
             if re.fullmatch(r'[A-Za-z]+_\d+', m_name):
                 l = re.split(r'_(\d+)', m_name)
@@ -132,6 +200,10 @@ def load_tf_weights_in_albert(model, config, tf_checkpoint_path):
                 pointer = getattr(pointer, 'weight')
             elif l[0] == 'squad':
                 pointer = getattr(pointer, 'classifier')
+            elif l[0] in ('query', 'key', 'value') and hasattr(pointer, 'qkv'):
+                # query/key/value live as stripes of the packed qkv projection
+                qkv_offset = ('query', 'key', 'value').index(l[0])
+                pointer = getattr(pointer, 'qkv')
             else:
                 try:
                     pointer = getattr(pointer, l[0])
@@ -146,17 +218,89 @@ def load_tf_weights_in_albert(model, config, tf_checkpoint_path):
             pointer = getattr(pointer, 'weight')
         elif m_name == 'kernel':
             array = np.transpose(array)
-        try:
-            assert pointer.shape == array.shape
-        except AssertionError as e:
-            e.args += (pointer.shape, array.shape)
-            raise
-        print("Initialize PyTorch weight {} from {}".format(name, original_name))
-        pointer.data = torch.from_numpy(array)
+        if qkv_offset is not None:
+            stripe = pointer.shape[0] // 3
+            target = pointer.data[qkv_offset * stripe: (qkv_offset + 1) * stripe]
+            try:
+                assert target.shape == array.shape
+            except AssertionError as e:
+                e.args += (target.shape, array.shape)
+                raise
+            print("Initialize PyTorch weight {} from {}".format(name, original_name))
+            target.copy_(torch.from_numpy(array))
+        else:
+            try:
+                assert pointer.shape == array.shape
+            except AssertionError as e:
+                e.args += (pointer.shape, array.shape)
+                raise
+            print("Initialize PyTorch weight {} from {}".format(name, original_name))
+            pointer.data = torch.from_numpy(array)
 
     return model
 
 
+class QuantizedLinear(nn.Module):
+    """Inference-only nn.Linear replacement with symmetric per-output-channel
+    INT8 weight storage (weights kept as int8 plus a float scale, dequantized
+    on the fly). Cuts weight memory roughly 4x; LayerNorm/Embedding modules
+    are intentionally left in full precision.
+    """
+    def __init__(self, linear):
+        super(QuantizedLinear, self).__init__()
+        self.in_features = linear.in_features
+        self.out_features = linear.out_features
+
+        weight = linear.weight.data
+        scale = weight.abs().max(dim=1)[0].clamp(min=1e-8) / 127.0
+        self.register_buffer('weight_int8', (weight / scale.unsqueeze(1)).round().to(torch.int8))
+        self.register_buffer('scale', scale)
+        if linear.bias is not None:
+            self.register_buffer('bias', linear.bias.data.clone())
+        else:
+            self.bias = None
+
+    def forward(self, input):
+        weight = self.weight_int8.to(input.dtype) * self.scale.unsqueeze(1).to(input.dtype)
+        return F.linear(input, weight, self.bias)
+
+
+def _quantize_linears(module):
+    """ Recursively swap every nn.Linear child of `module` for a QuantizedLinear."""
+    for name, child in module.named_children():
+        if isinstance(child, nn.Linear):
+            setattr(module, name, QuantizedLinear(child))
+        else:
+            _quantize_linears(child)
+
+
+def trace_for_inference(model, input_ids, attention_mask=None, token_type_ids=None):
+    """ Compile a model's forward with the TorchScript tracer for inference.
+
+        Scripting the QA forwards directly is still blocked by their
+        Optional-heavy signatures and tuple-slice outputs, so the inference
+        graph is captured by tracing on representative inputs instead, which
+        removes the per-op Python dispatch all the same. The traced module is
+        warmed up twice with optimized execution disabled so the profiling
+        executor's cold-start compilation does not hit the first real batch.
+    """
+    model.eval()
+    # Positional trace inputs: a None may only trail, never sit between two
+    # provided arguments, or the traced graph would silently bind
+    # token_type_ids to the attention_mask slot.
+    if attention_mask is None and token_type_ids is not None:
+        raise ValueError("token_type_ids requires attention_mask to be set as well")
+    example_inputs = tuple(
+        t for t in (input_ids, attention_mask, token_type_ids) if t is not None)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example_inputs)
+        if hasattr(torch.jit, "optimized_execution"):
+            with torch.jit.optimized_execution(False):
+                traced(*example_inputs)
+                traced(*example_inputs)
+    return traced
+
+
 class AlbertEmbeddings(BertEmbeddings):
     """
     Construct the embeddings from word, position and token_type embeddings.
@@ -167,7 +311,7 @@ class AlbertEmbeddings(BertEmbeddings):
         self.word_embeddings = nn.Embedding(config.vocab_size, config.embedding_size, padding_idx=0)
         self.position_embeddings = nn.Embedding(config.max_position_embeddings, config.embedding_size)
         self.token_type_embeddings = nn.Embedding(config.type_vocab_size, config.embedding_size)
-        self.LayerNorm = torch.nn.LayerNorm(config.embedding_size, eps=config.layer_norm_eps)
+        self.LayerNorm = AlbertLayerNorm(config.embedding_size, eps=config.layer_norm_eps)
 
 
 class AlbertAttention(BertSelfAttention):
@@ -176,11 +320,23 @@ class AlbertAttention(BertSelfAttention):
 
         self.output_attentions = config.output_attentions
         self.num_attention_heads = config.num_attention_heads
-        self.hidden_size = config.hidden_size 
+        self.hidden_size = config.hidden_size
         self.attention_head_size = config.hidden_size // config.num_attention_heads
+
+        # Pack the three H x H projections into one H x 3H GEMM; one large
+        # launch has much better tile utilization than three small ones.
+        del self.query
+        del self.key
+        del self.value
+        self.qkv = nn.Linear(config.hidden_size, 3 * config.hidden_size)
+
+        # "sdpa" (default) uses the fused kernel when available; "eager" forces
+        # the legacy matmul/softmax path, e.g. to compare numerics.
+        self.attn_implementation = getattr(config, "attn_implementation", "sdpa")
+
         self.dropout = nn.Dropout(config.attention_probs_dropout_prob)
         self.dense = nn.Linear(config.hidden_size, config.hidden_size)
-        self.LayerNorm = nn.LayerNorm(config.hidden_size, eps=config.layer_norm_eps)
+        self.LayerNorm = AlbertLayerNorm(config.hidden_size, eps=config.layer_norm_eps)
         self.pruned_heads = set()
 
     def prune_heads(self, heads):
@@ -195,10 +351,10 @@ class AlbertAttention(BertSelfAttention):
         mask = mask.view(-1).contiguous().eq(1)
         index = torch.arange(len(mask))[mask].long()
 
-        # Prune linear layers
-        self.query = prune_linear_layer(self.query, index)
-        self.key = prune_linear_layer(self.key, index)
-        self.value = prune_linear_layer(self.value, index)
+        # Prune linear layers (the packed projection holds the three H-sized stripes)
+        stripe = self.qkv.out_features // 3
+        qkv_index = torch.cat([index, index + stripe, index + 2 * stripe])
+        self.qkv = prune_linear_layer(self.qkv, qkv_index)
         self.dense = prune_linear_layer(self.dense, index, dim=1)
 
         # Update hyper params and store pruned heads
@@ -206,45 +362,71 @@ class AlbertAttention(BertSelfAttention):
         self.all_head_size = self.attention_head_size * self.num_attention_heads
         self.pruned_heads = self.pruned_heads.union(heads)
 
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict,
+                              missing_keys, unexpected_keys, error_msgs):
+        # Checkpoints store separate query/key/value projections; pack them.
+        if prefix + 'query.weight' in state_dict:
+            state_dict[prefix + 'qkv.weight'] = torch.cat(
+                [state_dict.pop(prefix + 'query.weight'),
+                 state_dict.pop(prefix + 'key.weight'),
+                 state_dict.pop(prefix + 'value.weight')], dim=0)
+            state_dict[prefix + 'qkv.bias'] = torch.cat(
+                [state_dict.pop(prefix + 'query.bias'),
+                 state_dict.pop(prefix + 'key.bias'),
+                 state_dict.pop(prefix + 'value.bias')], dim=0)
+        super(AlbertAttention, self)._load_from_state_dict(
+            state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs)
+
     def forward(self, input_ids, attention_mask=None, head_mask=None):
-        mixed_query_layer = self.query(input_ids)
-        mixed_key_layer = self.key(input_ids)
-        mixed_value_layer = self.value(input_ids)
+        mixed_query_layer, mixed_key_layer, mixed_value_layer = self.qkv(input_ids).chunk(3, dim=-1)
 
         query_layer = self.transpose_for_scores(mixed_query_layer)
         key_layer = self.transpose_for_scores(mixed_key_layer)
         value_layer = self.transpose_for_scores(mixed_value_layer)
 
-        # Take the dot product between "query" and "key" to get the raw attention scores.
-        attention_scores = torch.matmul(query_layer, key_layer.transpose(-1, -2))
-        attention_scores = attention_scores / math.sqrt(self.attention_head_size)
-        if attention_mask is not None:
-            # Apply the attention mask is (precomputed for all layers in BertModel forward() function)
-            attention_scores = attention_scores + attention_mask
-
-        # Normalize the attention scores to probabilities.
-        attention_probs = nn.Softmax(dim=-1)(attention_scores)
-
-        # This is actually dropping out entire tokens to attend to, which might
-        # seem a bit unusual, but is taken from the original Transformer paper.
-        attention_probs = self.dropout(attention_probs)
-
-        # Mask heads if we want to
-        if head_mask is not None:
-            attention_probs = attention_probs * head_mask
-
-        context_layer = torch.matmul(attention_probs, value_layer)
-
-        context_layer = context_layer.permute(0, 2, 1, 3).contiguous()
-        new_context_layer_shape = context_layer.size()[:-2] + (self.all_head_size,)
-        reshaped_context_layer = context_layer.view(*new_context_layer_shape)
-        
-
-        # Should find a better way to do this
-        w = self.dense.weight.t().view(self.num_attention_heads, self.attention_head_size, self.hidden_size).to(context_layer.dtype)
-        b = self.dense.bias.to(context_layer.dtype)
-
-        projected_context_layer = torch.einsum("bfnd,ndh->bfh", context_layer, w) + b
+        if (_HAS_SDPA and self.attn_implementation == "sdpa"
+                and not self.output_attentions and head_mask is None):
+            # Fused kernel never materializes the (batch, heads, seq, seq) score matrix.
+            # FlashAttention does not expose the attention probabilities, so the
+            # output_attentions/head_mask paths keep the legacy implementation below.
+            context_layer = F.scaled_dot_product_attention(
+                query_layer, key_layer, value_layer,
+                attn_mask=attention_mask,
+                dropout_p=self.dropout.p if self.training else 0.0)
+            attention_probs = None
+        else:
+            # Take the dot product between "query" and "key" to get the raw attention scores.
+            # The scores are freshly allocated by the matmul, so scaling and
+            # masking them in place is autograd-safe and skips two S x S
+            # temporaries per layer.
+            attention_scores = torch.matmul(query_layer, key_layer.transpose(-1, -2))
+            attention_scores.div_(math.sqrt(self.attention_head_size))
+            if attention_mask is not None:
+                # Apply the boolean attention mask (precomputed for all layers in AlbertModel forward)
+                attention_scores.masked_fill_(~attention_mask, torch.finfo(attention_scores.dtype).min)
+
+            # Normalize the attention scores to probabilities.
+            attention_probs = F.softmax(attention_scores, dim=-1)
+
+            # This is actually dropping out entire tokens to attend to, which might
+            # seem a bit unusual, but is taken from the original Transformer paper.
+            attention_probs = self.dropout(attention_probs)
+
+            # Mask heads if we want to
+            if head_mask is not None:
+                attention_probs = attention_probs * head_mask
+
+            context_layer = torch.matmul(attention_probs, value_layer)
+
+        # Merge the heads back with transpose + reshape; reshape only copies
+        # when the strides require it, instead of always forcing a materialized
+        # transpose through .contiguous().
+        context_layer = context_layer.transpose(1, 2).reshape(
+            context_layer.size(0), context_layer.size(2), self.all_head_size)
+
+        # With the heads flattened back into the hidden dimension, the old
+        # "bfnd,ndh->bfh" einsum is just the dense projection itself.
+        projected_context_layer = self.dense(context_layer)
         projected_context_layer_dropout = self.dropout(projected_context_layer)
         layernormed_context_layer = self.LayerNorm(input_ids + projected_context_layer_dropout)
         return (layernormed_context_layer, attention_probs) if self.output_attentions else (layernormed_context_layer,)
@@ -255,18 +437,41 @@ class AlbertLayer(nn.Module):
         super(AlbertLayer, self).__init__()
         
         self.config = config
-        self.full_layer_layer_norm = nn.LayerNorm(config.hidden_size, eps=config.layer_norm_eps)
+        self.full_layer_layer_norm = AlbertLayerNorm(config.hidden_size, eps=config.layer_norm_eps)
         self.attention = AlbertAttention(config)
         self.ffn = nn.Linear(config.hidden_size, config.intermediate_size) 
         self.ffn_output = nn.Linear(config.intermediate_size, config.hidden_size)
         self.activation = ACT2FN[config.hidden_act]
+        # apex FusedLayerNorm is already a single kernel; only route through the
+        # scripted helper when we are on the plain torch.nn.LayerNorm fallback.
+        self.use_scripted_layer_norm = AlbertLayerNorm is torch.nn.LayerNorm
 
-    def forward(self, hidden_states, attention_mask=None, head_mask=None):
-        attention_output = self.attention(hidden_states, attention_mask, head_mask)
-        ffn_output = self.ffn(attention_output[0])
+    def _ffn_forward(self, attention_output):
+        ffn_output = self.ffn(attention_output)
         ffn_output = self.activation(ffn_output)
         ffn_output = self.ffn_output(ffn_output)
-        hidden_states = self.full_layer_layer_norm(ffn_output + attention_output[0])
+        if self.use_scripted_layer_norm:
+            return _residual_layer_norm(ffn_output, attention_output,
+                                        self.full_layer_layer_norm.weight,
+                                        self.full_layer_layer_norm.bias,
+                                        self.config.layer_norm_eps)
+        return self.full_layer_layer_norm(ffn_output + attention_output)
+
+    def forward(self, hidden_states, attention_mask=None, head_mask=None):
+        attention_output = self.attention(hidden_states, attention_mask, head_mask)
+        # Fuse the FFN tail into generated kernels where the compiler exists;
+        # fall back to the eager path under jit tracing (nested compile raises
+        # on torch 2.x) and after dynamic quantization (raw weights are gone).
+        if (_compiled_ffn_tail is not None and not torch.jit.is_tracing()
+                and isinstance(self.ffn, nn.Linear)):
+            hidden_states = _compiled_ffn_tail(
+                attention_output[0], self.activation,
+                self.ffn.weight, self.ffn.bias,
+                self.ffn_output.weight, self.ffn_output.bias,
+                self.full_layer_layer_norm.weight, self.full_layer_layer_norm.bias,
+                self.config.layer_norm_eps)
+        else:
+            hidden_states = self._ffn_forward(attention_output[0])
 
         return (hidden_states,) + attention_output[1:]  # add attentions if we output them
 
@@ -280,24 +485,24 @@ class AlbertLayerGroup(nn.Module):
         self.albert_layers = nn.ModuleList([AlbertLayer(config) for _ in range(config.inner_group_num)])
 
     def forward(self, hidden_states, attention_mask=None, head_mask=None):
-        layer_hidden_states = ()
-        layer_attentions = ()
+        layer_hidden_states = []
+        layer_attentions = []
 
         for layer_index, albert_layer in enumerate(self.albert_layers):
             layer_output = albert_layer(hidden_states, attention_mask, head_mask[layer_index])
             hidden_states = layer_output[0]
 
             if self.output_attentions:
-                layer_attentions = layer_attentions + (layer_output[1],)
+                layer_attentions.append(layer_output[1])
 
             if self.output_hidden_states:
-                layer_hidden_states = layer_hidden_states + (hidden_states,)
+                layer_hidden_states.append(hidden_states)
 
         outputs = (hidden_states,)
         if self.output_hidden_states:
-            outputs = outputs + (layer_hidden_states,)
+            outputs = outputs + (tuple(layer_hidden_states),)
         if self.output_attentions:
-            outputs = outputs + (layer_attentions,)
+            outputs = outputs + (tuple(layer_attentions),)
         return outputs  # last-layer hidden state, (layer hidden states), (layer attentions)
 
 
@@ -311,39 +516,51 @@ class AlbertTransformer(nn.Module):
         self.embedding_hidden_mapping_in = nn.Linear(config.embedding_size, config.hidden_size)
         self.albert_layer_groups = nn.ModuleList([AlbertLayerGroup(config) for _ in range(config.num_hidden_groups)])
 
+        # Number of layers in a hidden group and how often each group is
+        # replayed with its shared weights -- constants of the config.
+        self.layers_per_group = config.num_hidden_layers // config.num_hidden_groups
+        self.group_repeats = max(self.layers_per_group // config.inner_group_num, 1)
+
+    def partition_head_mask(self, head_mask):
+        """ Split a flat per-layer head mask into the per-(group, repeat)
+            windows consumed by forward, so the hot loop indexes a prebuilt
+            structure instead of slicing every iteration.
+        """
+        inner_group_num = self.config.inner_group_num
+        return [[head_mask[group_idx * self.layers_per_group + repeat_idx * inner_group_num:
+                           group_idx * self.layers_per_group + (repeat_idx + 1) * inner_group_num]
+                 for repeat_idx in range(self.group_repeats)]
+                for group_idx in range(self.config.num_hidden_groups)]
+
     def forward(self, hidden_states, attention_mask=None, head_mask=None):
+        # head_mask is expected pre-partitioned by partition_head_mask:
+        # head_mask[group_idx][repeat_idx] is the window for one group call.
         hidden_states = self.embedding_hidden_mapping_in(hidden_states)
 
-        all_attentions = ()
+        all_attentions = []
 
         if self.output_hidden_states:
-            all_hidden_states = (hidden_states,)
+            all_hidden_states = [hidden_states]
 
-        for i in range(self.config.num_hidden_layers):
-            # Number of layers in a hidden group
-            layers_per_group = int(self.config.num_hidden_layers / self.config.num_hidden_groups)
+        for group_idx in range(self.config.num_hidden_groups):
+            albert_layer_group = self.albert_layer_groups[group_idx]
+            group_head_mask = head_mask[group_idx]
+            for repeat_idx in range(self.group_repeats):
+                layer_group_output = albert_layer_group(hidden_states, attention_mask,
+                                                        group_head_mask[repeat_idx])
+                hidden_states = layer_group_output[0]
 
-            # Index of the hidden group
-            group_idx = int(i / (self.config.num_hidden_layers / self.config.num_hidden_groups))
+                if self.output_attentions:
+                    all_attentions.extend(layer_group_output[-1])
 
-            # Index of the layer inside the group
-            layer_idx = int(i - group_idx * layers_per_group)
-            
-            layer_group_output = self.albert_layer_groups[group_idx](hidden_states, attention_mask, head_mask[group_idx*layers_per_group:(group_idx+1)*layers_per_group])  
-            hidden_states = layer_group_output[0]
+                if self.output_hidden_states:
+                    all_hidden_states.append(hidden_states)
 
-            if self.output_attentions:
-                all_attentions = all_attentions + layer_group_output[-1]
-
-            if self.output_hidden_states:
-                all_hidden_states = all_hidden_states + (hidden_states,)
-
-        
         outputs = (hidden_states,)
         if self.output_hidden_states:
-            outputs = outputs + (all_hidden_states,)
+            outputs = outputs + (tuple(all_hidden_states),)
         if self.output_attentions:
-            outputs = outputs + (all_attentions,)
+            outputs = outputs + (tuple(all_attentions),)
         return outputs  # last-layer hidden state, (all hidden states), (all attentions)
 
 
@@ -365,10 +582,20 @@ class AlbertPreTrainedModel(PreTrainedModel):
             module.weight.data.normal_(mean=0.0, std=self.config.initializer_range)
             if isinstance(module, (nn.Linear)) and module.bias is not None:
                 module.bias.data.zero_()
-        elif isinstance(module, nn.LayerNorm):
+        elif isinstance(module, (nn.LayerNorm, AlbertLayerNorm)):
             module.bias.data.zero_()
             module.weight.data.fill_(1.0)
 
+    def to_int8(self):
+        """ Dynamically quantize every nn.Linear (encoder and task head) to
+            INT8 for CPU inference: weights stored as int8 with per-tensor
+            scales, activations quantized on the fly, matmuls run through
+            FBGEMM/QNNPACK. Inference-only; quantize after loading weights.
+        """
+        if not hasattr(torch, "quantization"):
+            raise RuntimeError("Dynamic quantization is not supported by this torch build")
+        return torch.quantization.quantize_dynamic(self, {nn.Linear}, dtype=torch.qint8)
+
 
 ALBERT_START_DOCSTRING = r"""    The ALBERT model was proposed in
     `ALBERT: A Lite BERT for Self-supervised Learning of Language Representations`_
@@ -469,8 +696,26 @@ class AlbertModel(AlbertPreTrainedModel):
         self.pooler = nn.Linear(config.hidden_size, config.hidden_size)
         self.pooler_activation = nn.Tanh()
 
+        # Opt-in CUDA Graph replay of the encoder for fixed-shape inference,
+        # see enable_cuda_graph(). Not part of the state dict.
+        self.use_cuda_graph = False
+        self._cuda_graph = None
+        self._graph_input = None
+        self._graph_mask = None
+        self._graph_output = None
+
         self.init_weights()
 
+    def quantize(self):
+        """ Quantize the encoder projection weights to INT8 for inference.
+            All nn.Linear modules in the encoder (qkv/dense/ffn/ffn_output and
+            the embedding-to-hidden mapping) are swapped for QuantizedLinear;
+            embeddings and layer norms keep full precision. Irreversible, and
+            meant for inference only.
+        """
+        _quantize_linears(self.encoder)
+        return self
+
     def get_input_embeddings(self):
         return self.embeddings.word_embeddings
 
@@ -501,8 +746,65 @@ class AlbertModel(AlbertPreTrainedModel):
             inner_group_idx = int(layer - group_idx * self.config.inner_group_num)
             self.encoder.albert_layer_groups[group_idx].albert_layers[inner_group_idx].attention.prune_heads(heads)
 
+    def enable_cuda_graph(self):
+        """ Capture the encoder into a CUDA Graph on the next eval forward and
+            replay it afterwards, eliminating per-kernel launch overhead. Only
+            worthwhile for fixed-shape, small-batch inference; training mode, a
+            shape change or output_hidden_states/output_attentions fall back to
+            (or recapture) the regular forward.
+        """
+        if not hasattr(torch.cuda, "CUDAGraph"):
+            raise RuntimeError("CUDA Graphs are not supported by this torch build")
+        self.use_cuda_graph = True
+        return self
+
+    def _encode(self, embedding_output, extended_attention_mask, head_mask):
+        # A real head mask cannot ride along on replay (it is baked in at
+        # capture time), so it forces the eager path like the other fallbacks.
+        head_mask_active = any(
+            not all(m is None for m in window)
+            for group in head_mask for window in group)
+        if (not self.use_cuda_graph or self.training or not embedding_output.is_cuda
+                or head_mask_active
+                or self.config.output_hidden_states or self.config.output_attentions):
+            return self.encoder(embedding_output, extended_attention_mask, head_mask=head_mask)
+
+        if self._cuda_graph is None or self._graph_input.shape != embedding_output.shape:
+            # (Re)capture: static input/mask buffers, two warmup runs on a side
+            # stream, then record the encoder once.
+            self._graph_input = embedding_output.clone()
+            self._graph_mask = extended_attention_mask.clone()
+            stream = torch.cuda.Stream()
+            stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(stream):
+                for _ in range(2):
+                    self.encoder(self._graph_input, self._graph_mask, head_mask=head_mask)
+            torch.cuda.current_stream().wait_stream(stream)
+
+            self._cuda_graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(self._cuda_graph):
+                self._graph_output = self.encoder(self._graph_input, self._graph_mask, head_mask=head_mask)[0]
+            # Capture only records the kernels without running them; replay
+            # once so _graph_output holds real hidden states for the live
+            # batch already sitting in the static buffers.
+            self._cuda_graph.replay()
+        else:
+            self._graph_input.copy_(embedding_output)
+            self._graph_mask.copy_(extended_attention_mask)
+            self._cuda_graph.replay()
+        return (self._graph_output,)
+
+    def compute_embeddings(self, input_ids=None, token_type_ids=None, position_ids=None, inputs_embeds=None):
+        """ Precompute the normed embedding output for a batch so that repeated
+            forwards over the same input (e.g. doc-stride MRC evaluation) can
+            pass it back through `cached_embeddings` and skip the embedding
+            lookup, position/type add and layer norm.
+        """
+        return self.embeddings(input_ids, position_ids=position_ids, token_type_ids=token_type_ids,
+                               inputs_embeds=inputs_embeds)
+
     def forward(self, input_ids=None, attention_mask=None, token_type_ids=None, position_ids=None, head_mask=None,
-                inputs_embeds=None):
+                inputs_embeds=None, cached_embeddings=None):
 
         if input_ids is not None and inputs_embeds is not None:
             raise ValueError("You cannot specify both input_ids and inputs_embeds at the same time")
@@ -520,28 +822,40 @@ class AlbertModel(AlbertPreTrainedModel):
         if token_type_ids is None:
             token_type_ids = torch.zeros(input_shape, dtype=torch.long, device=device)
 
-        extended_attention_mask = attention_mask.unsqueeze(1).unsqueeze(2)
-        extended_attention_mask = extended_attention_mask.to(dtype=next(self.parameters()).dtype) # fp16 compatibility
-        extended_attention_mask = (1.0 - extended_attention_mask) * -10000.0
+        # Boolean mask (True = attend), built once for all layers. The fused
+        # attention kernel consumes it directly, and the legacy path applies it
+        # with a single masked_fill instead of materializing an additive mask
+        # and broadcast-adding it to the scores in every layer.
+        extended_attention_mask = attention_mask.unsqueeze(1).unsqueeze(2).to(torch.bool)
         if head_mask is not None:
             if head_mask.dim() == 1:
                 head_mask = head_mask.unsqueeze(0).unsqueeze(0).unsqueeze(-1).unsqueeze(-1)
                 head_mask = head_mask.expand(self.config.num_hidden_layers, -1, -1, -1, -1)
             elif head_mask.dim() == 2:
                 head_mask = head_mask.unsqueeze(1).unsqueeze(-1).unsqueeze(-1)  # We can specify head_mask for each layer
-            head_mask = head_mask.to(dtype=next(self.parameters()).dtype) # switch to fload if need + fp16 compatibility
+            # fp16 compatibility; direct attribute read instead of walking the parameter generator
+            head_mask = head_mask.to(dtype=self.embeddings.word_embeddings.weight.dtype)
         else:
             head_mask = [None] * self.config.num_hidden_layers
+        head_mask = self.encoder.partition_head_mask(head_mask)
 
-        embedding_output = self.embeddings(input_ids, position_ids=position_ids, token_type_ids=token_type_ids,
-                                           inputs_embeds=inputs_embeds)
-        encoder_outputs = self.encoder(embedding_output,
-                                       extended_attention_mask,
-                                       head_mask=head_mask)
+        if cached_embeddings is not None:
+            embedding_output = cached_embeddings
+        else:
+            embedding_output = self.embeddings(input_ids, position_ids=position_ids, token_type_ids=token_type_ids,
+                                               inputs_embeds=inputs_embeds)
+        encoder_outputs = self._encode(embedding_output, extended_attention_mask, head_mask)
 
         sequence_output = encoder_outputs[0]
 
-        pooled_output = self.pooler_activation(self.pooler(sequence_output[:, 0]))
+        # select() is a zero-copy view of the CLS token (faster than advanced
+        # indexing) and the scripted helper fuses the linear with the tanh.
+        # After dynamic quantization the pooler no longer exposes weight/bias
+        # as tensors, so run it as a module there.
+        if isinstance(self.pooler, nn.Linear):
+            pooled_output = _fused_pool(sequence_output.select(1, 0), self.pooler.weight, self.pooler.bias)
+        else:
+            pooled_output = self.pooler_activation(self.pooler(sequence_output.select(1, 0)))
 
         outputs = (sequence_output, pooled_output) + encoder_outputs[1:]  # add hidden_states and attentions if they are here
         return outputs
@@ -550,7 +864,7 @@ class AlbertMLMHead(nn.Module):
     def __init__(self, config):
         super(AlbertMLMHead, self).__init__()
 
-        self.LayerNorm = nn.LayerNorm(config.embedding_size)
+        self.LayerNorm = AlbertLayerNorm(config.embedding_size)
         self.bias = nn.Parameter(torch.zeros(config.vocab_size))
         self.dense = nn.Linear(config.hidden_size, config.embedding_size)
         self.decoder = nn.Linear(config.embedding_size, config.vocab_size)
@@ -621,12 +935,27 @@ class AlbertForMaskedLM(AlbertPreTrainedModel):
         )
         sequence_outputs = outputs[0]
 
-        prediction_scores = self.predictions(sequence_outputs)
+        # The decoder GEMM (embedding_size -> vocab_size) dominates memory
+        # bandwidth; run the head in half precision and keep the loss fp32.
+        use_bf16 = (sequence_outputs.is_cuda and hasattr(torch, "autocast")
+                    and hasattr(torch.cuda, "is_bf16_supported") and torch.cuda.is_bf16_supported())
+        if use_bf16:
+            # bf16 keeps the fp32 exponent range, so the backward through the
+            # vocab GEMM needs no GradScaler.
+            with torch.autocast("cuda", dtype=torch.bfloat16):
+                prediction_scores = self.predictions(sequence_outputs)
+        elif _amp_autocast is not None and sequence_outputs.is_cuda and not self.training:
+            # fp16 gradients can overflow without a scaler, so only use it
+            # when there is no backward.
+            with _amp_autocast():
+                prediction_scores = self.predictions(sequence_outputs)
+        else:
+            prediction_scores = self.predictions(sequence_outputs)
 
         outputs = (prediction_scores,) + outputs[2:]  # Add hidden states and attention if they are here
         if masked_lm_labels is not None:
             loss_fct = CrossEntropyLoss(ignore_index=-1)
-            masked_lm_loss = loss_fct(prediction_scores.view(-1, self.config.vocab_size), masked_lm_labels.view(-1))
+            masked_lm_loss = loss_fct(prediction_scores.float().view(-1, self.config.vocab_size), masked_lm_labels.view(-1))
             outputs = (masked_lm_loss,) + outputs
 
         return outputs
@@ -773,29 +1102,25 @@ class AlbertForQuestionAnswering(AlbertPreTrainedModel):
             inputs_embeds=inputs_embeds
         )
 
-        sequence_output = outputs[0]
+        # contiguous() is a no-op when the encoder output is already dense; the
+        # hint keeps cuBLAS on its fast path for the head GEMMs either way.
+        sequence_output = outputs[0].contiguous()
 
-        logits = self.qa_outputs(sequence_output)
-        start_logits, end_logits = logits.split(1, dim=-1)
-        start_logits = start_logits.squeeze(-1)
-        end_logits = end_logits.squeeze(-1)
+        start_logits, end_logits = self.qa_outputs(sequence_output).unbind(dim=-1)
 
         outputs = (start_logits, end_logits,) + outputs[2:]
         if start_positions is not None and end_positions is not None:
-            # If we are on multi-GPU, split add a dimension
-            if len(start_positions.size()) > 1:
-                start_positions = start_positions.squeeze(-1)
-            if len(end_positions.size()) > 1:
-                end_positions = end_positions.squeeze(-1)
             # sometimes the start/end positions are outside our model inputs, we ignore these terms
-            ignored_index = start_logits.size(1)
-            start_positions.clamp_(0, ignored_index)
-            end_positions.clamp_(0, ignored_index)
-
-            loss_fct = CrossEntropyLoss(ignore_index=ignored_index)
-            start_loss = loss_fct(start_logits, start_positions)
-            end_loss = loss_fct(end_logits, end_positions)
-            total_loss = (start_loss + end_loss) / 2
+            ignored_index = start_logits.shape[1]
+            start_positions = _clamp_positions(start_positions, ignored_index)
+            end_positions = _clamp_positions(end_positions, ignored_index)
+
+            # One softmax+NLL launch over the stacked (2B, S) logits instead of
+            # two; the mean over both halves matches (start_loss + end_loss) / 2.
+            total_loss = F.cross_entropy(
+                torch.cat([start_logits, end_logits], dim=0),
+                torch.cat([start_positions, end_positions], dim=0),
+                ignore_index=ignored_index)
             outputs = (total_loss,) + outputs
 
         return outputs  # (loss), start_logits, end_logits, (hidden_states), (attentions)
@@ -807,10 +1132,27 @@ class AlbertForQuestionAnsweringDep(AlbertPreTrainedModel):
 
         self.albert = AlbertModel(config)
         self.start_outputs = nn.Linear(config.hidden_size, 1)
-        self.end_pooler = nn.Linear(1 + config.hidden_size, 512)
+        self.end_pooler_h = nn.Linear(config.hidden_size, 512)
+        self.end_pooler_s = nn.Parameter(
+            torch.empty(512).normal_(mean=0.0, std=config.initializer_range))
         self.end_outputs = nn.Linear(512, 1)
         self.init_weights()
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        """ Older checkpoints store one end_pooler acting on the concatenated
+            [start_logit; hidden_states]; peel off column 0 as the scalar
+            stripe and keep the rest as the hidden projection.
+        """
+        weight_key = prefix + "end_pooler.weight"
+        if weight_key in state_dict:
+            weight = state_dict.pop(weight_key)
+            state_dict[prefix + "end_pooler_s"] = weight[:, 0]
+            state_dict[prefix + "end_pooler_h.weight"] = weight[:, 1:]
+            bias_key = prefix + "end_pooler.bias"
+            if bias_key in state_dict:
+                state_dict[prefix + "end_pooler_h.bias"] = state_dict.pop(bias_key)
+        super(AlbertForQuestionAnsweringDep, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
     def forward(self, input_ids=None, attention_mask=None, token_type_ids=None, position_ids=None, head_mask=None,
                 inputs_embeds=None, start_positions=None, end_positions=None):
 
@@ -823,46 +1165,50 @@ class AlbertForQuestionAnsweringDep(AlbertPreTrainedModel):
             inputs_embeds=inputs_embeds
         )
 
-        sequence_output = outputs[0]
+        sequence_output = outputs[0].contiguous()
 
-        answer_mask = attention_mask * token_type_ids
-        answer_mask = answer_mask.to(dtype=next(self.parameters()).dtype)  # fp16 compatibility
-        # batch, seq
-        device = input_ids.device
-        one_tensor = torch.ones((answer_mask.size(0), 1), device=device).to(
-            dtype=next(self.parameters()).dtype)  # fp16 compatibility
-        answer_mask = torch.cat([one_tensor, answer_mask[:, 1:]], dim=-1)
+        # batch, seq; True marks positions eligible to hold the answer
+        answer_mask = (attention_mask * token_type_ids).to(torch.bool)
+        answer_mask[:, 0] = True  # keep [CLS] visible for the no-answer score
 
         start_logits = self.start_outputs(sequence_output)
         start_logits = start_logits.squeeze(-1)
-        start_logits += 1000.0 * (answer_mask - 1)
+        # -1000 rather than finfo.min: the masked start logits feed the end
+        # pooler as an input feature, where an extreme sentinel would swamp
+        # the GEMM; -1000 already drives the softmax to zero.
+        start_logits = start_logits.masked_fill(~answer_mask, -1000.0)
         # batch, seq
-        start_logits = start_logits.unsqueeze(-1)
 
-        final_repr = gelu(self.end_pooler(torch.cat([start_logits, sequence_output], dim=-1)))
-        end_logits = self.end_outputs(final_repr)
+        seq_len = sequence_output.size(1)
+        if not self.training and attention_mask is not None:
+            # Right padding is dead compute for the end head at inference; run
+            # it on the longest real length in the batch and pad back after.
+            active_len = int(attention_mask.sum(-1).max().item())
+        else:
+            active_len = seq_len
 
-        start_logits = start_logits.squeeze(-1)
-        end_logits = end_logits.squeeze(-1)
+        final_repr = F.gelu(
+            self.end_pooler_h(sequence_output[:, :active_len])
+            + start_logits[:, :active_len].unsqueeze(-1) * self.end_pooler_s)
+        end_logits = self.end_outputs(final_repr).squeeze(-1)
+        if active_len < seq_len:
+            end_logits = F.pad(end_logits, (0, seq_len - active_len), value=-1e4)
 
-        end_logits += 1000.0 * (answer_mask - 1)
+        end_logits = end_logits.masked_fill(~answer_mask, -1000.0)
 
         outputs = (start_logits, end_logits,) + outputs[2:]
         if start_positions is not None and end_positions is not None:
-            # If we are on multi-GPU, split add a dimension
-            if len(start_positions.size()) > 1:
-                start_positions = start_positions.squeeze(-1)
-            if len(end_positions.size()) > 1:
-                end_positions = end_positions.squeeze(-1)
             # sometimes the start/end positions are outside our model inputs, we ignore these terms
-            ignored_index = start_logits.size(1)
-            start_positions.clamp_(0, ignored_index)
-            end_positions.clamp_(0, ignored_index)
-
-            loss_fct = CrossEntropyLoss(ignore_index=ignored_index)
-            start_loss = loss_fct(start_logits, start_positions)
-            end_loss = loss_fct(end_logits, end_positions)
-            total_loss = (start_loss + end_loss) / 2
+            ignored_index = start_logits.shape[1]
+            start_positions = _clamp_positions(start_positions, ignored_index)
+            end_positions = _clamp_positions(end_positions, ignored_index)
+
+            # One softmax+NLL launch over the stacked (2B, S) logits instead of
+            # two; the mean over both halves matches (start_loss + end_loss) / 2.
+            total_loss = F.cross_entropy(
+                torch.cat([start_logits, end_logits], dim=0),
+                torch.cat([start_positions, end_positions], dim=0),
+                ignore_index=ignored_index)
             outputs = (total_loss,) + outputs
 
         return outputs  # (loss), start_logits, end_logits, (hidden_states), (attentions)
@@ -874,11 +1220,28 @@ class AlbertForQuestionAnsweringDep2(AlbertPreTrainedModel):
 
         self.albert = AlbertModel(config)
         self.start_outputs = nn.Linear(config.hidden_size, 1)
-        self.end_pooler = nn.Linear(1 + config.hidden_size, 512)
+        self.end_pooler_h = nn.Linear(config.hidden_size, 512)
+        self.end_pooler_s = nn.Parameter(
+            torch.empty(512).normal_(mean=0.0, std=config.initializer_range))
         self.end_outputs = nn.Linear(512, 1)
 
         self.init_weights()
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        """ Older checkpoints store one end_pooler acting on the concatenated
+            [start_logit; hidden_states]; peel off column 0 as the scalar
+            stripe and keep the rest as the hidden projection.
+        """
+        weight_key = prefix + "end_pooler.weight"
+        if weight_key in state_dict:
+            weight = state_dict.pop(weight_key)
+            state_dict[prefix + "end_pooler_s"] = weight[:, 0]
+            state_dict[prefix + "end_pooler_h.weight"] = weight[:, 1:]
+            bias_key = prefix + "end_pooler.bias"
+            if bias_key in state_dict:
+                state_dict[prefix + "end_pooler_h.bias"] = state_dict.pop(bias_key)
+        super(AlbertForQuestionAnsweringDep2, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
     def forward(self, input_ids=None, attention_mask=None, token_type_ids=None, position_ids=None, head_mask=None,
                 inputs_embeds=None, start_positions=None, end_positions=None):
 
@@ -891,35 +1254,29 @@ class AlbertForQuestionAnsweringDep2(AlbertPreTrainedModel):
             inputs_embeds=inputs_embeds
         )
 
-        sequence_output = outputs[0]
+        sequence_output = outputs[0].contiguous()
 
-        start_logits = self.start_outputs(sequence_output)
-        start_logits = start_logits.squeeze(-1)
+        start_logits = self.start_outputs(sequence_output).squeeze(-1)
         # batch, seq
-        start_logits = start_logits.unsqueeze(-1)
 
-        final_repr = gelu(self.end_pooler(torch.cat([start_logits, sequence_output], dim=-1)))
-        end_logits = self.end_outputs(final_repr)
-
-        start_logits = start_logits.squeeze(-1)
-        end_logits = end_logits.squeeze(-1)
+        final_repr = F.gelu(
+            self.end_pooler_h(sequence_output)
+            + start_logits.unsqueeze(-1) * self.end_pooler_s)
+        end_logits = self.end_outputs(final_repr).squeeze(-1)
 
         outputs = (start_logits, end_logits,) + outputs[2:]
         if start_positions is not None and end_positions is not None:
-            # If we are on multi-GPU, split add a dimension
-            if len(start_positions.size()) > 1:
-                start_positions = start_positions.squeeze(-1)
-            if len(end_positions.size()) > 1:
-                end_positions = end_positions.squeeze(-1)
             # sometimes the start/end positions are outside our model inputs, we ignore these terms
-            ignored_index = start_logits.size(1)
-            start_positions.clamp_(0, ignored_index)
-            end_positions.clamp_(0, ignored_index)
-
-            loss_fct = CrossEntropyLoss(ignore_index=ignored_index)
-            start_loss = loss_fct(start_logits, start_positions)
-            end_loss = loss_fct(end_logits, end_positions)
-            total_loss = (start_loss + end_loss) / 2
+            ignored_index = start_logits.shape[1]
+            start_positions = _clamp_positions(start_positions, ignored_index)
+            end_positions = _clamp_positions(end_positions, ignored_index)
+
+            # One softmax+NLL launch over the stacked (2B, S) logits instead of
+            # two; the mean over both halves matches (start_loss + end_loss) / 2.
+            total_loss = F.cross_entropy(
+                torch.cat([start_logits, end_logits], dim=0),
+                torch.cat([start_positions, end_positions], dim=0),
+                ignore_index=ignored_index)
             outputs = (total_loss,) + outputs
 
         return outputs  # (loss), start_logits, end_logits, (hidden_states), (attentions)
@@ -947,52 +1304,39 @@ class AlbertForQuestionAnsweringAVPool(AlbertPreTrainedModel):
             inputs_embeds=inputs_embeds
         )
 
-        sequence_output = outputs[0]
+        # contiguous() is a no-op when the encoder output is already dense; the
+        # hint keeps cuBLAS on its fast path for the head GEMMs either way.
+        sequence_output = outputs[0].contiguous()
 
-        logits = self.qa_outputs(sequence_output)
-        start_logits, end_logits = logits.split(1, dim=-1)
-        start_logits = start_logits.squeeze(-1)
-        end_logits = end_logits.squeeze(-1)
+        start_logits, end_logits = self.qa_outputs(sequence_output).unbind(dim=-1)
 
-        first_word = sequence_output[:, 0, :]
+        # Contiguous copy of the [CLS] state so the classifier GEMM gets a
+        # dense row-major input instead of a strided view of sequence_output.
+        first_word = sequence_output[:, 0, :].contiguous()
 
         # has_inp = torch.cat([p_avg, first_word, q_summ, p_avg_p], -1)
         has_log = self.has_ans(first_word)
 
         outputs = (start_logits, end_logits, has_log,) + outputs[2:]
         if start_positions is not None and end_positions is not None:
-            # If we are on multi-GPU, split add a dimension
-            if len(start_positions.size()) > 1:
-                start_positions = start_positions.squeeze(-1)
-            if len(end_positions.size()) > 1:
-                end_positions = end_positions.squeeze(-1)
-            if len(is_impossibles.size()) > 1:
-                is_impossibles = is_impossibles.squeeze(-1)
             # sometimes the start/end positions are outside our model inputs, we ignore these terms
-            ignored_index = start_logits.size(1)
-            start_positions.clamp_(0, ignored_index)
-            end_positions.clamp_(0, ignored_index)
-            is_impossibles.clamp_(0, ignored_index)
-
-            loss_fct = CrossEntropyLoss(ignore_index=ignored_index)
-            start_loss = loss_fct(start_logits, start_positions)
-            end_loss = loss_fct(end_logits, end_positions)
-            choice_loss = loss_fct(has_log, is_impossibles)
-            total_loss = (start_loss + end_loss + choice_loss) / 3
+            ignored_index = start_logits.shape[1]
+            start_positions = _clamp_positions(start_positions, ignored_index)
+            end_positions = _clamp_positions(end_positions, ignored_index)
+            is_impossibles = _clamp_positions(is_impossibles, ignored_index)
+
+            span_loss = F.cross_entropy(
+                torch.cat([start_logits, end_logits], dim=0),
+                torch.cat([start_positions, end_positions], dim=0),
+                ignore_index=ignored_index)
+            choice_loss = F.cross_entropy(has_log, is_impossibles, ignore_index=ignored_index)
+            total_loss = (2 * span_loss + choice_loss) / 3
             outputs = (total_loss,) + outputs
             #print(sum(is_impossibles==1),sum(is_impossibles==0))
             # print(start_logits, end_logits, has_log, is_impossibles)
             # print(start_loss, end_loss, choice_loss)
         return outputs  # (loss), start_logits, end_logits, (hidden_states), (attentions)
 
-def gelu(x):
-    """ Original Implementation of the gelu activation function in Google Bert repo when initially created.
-        For information: OpenAI GPT's gelu is slightly different (and gives slightly different results):
-        0.5 * x * (1 + torch.tanh(math.sqrt(2 / math.pi) * (x + 0.044715 * torch.pow(x, 3))))
-        Also see https://arxiv.org/abs/1606.08415
-    """
-    return x * 0.5 * (1.0 + torch.erf(x / math.sqrt(2.0)))
-
 class AlbertForQuestionAnsweringAVPoolBCEv3(AlbertPreTrainedModel):
     def __init__(self, config):
         super(AlbertForQuestionAnsweringAVPoolBCEv3, self).__init__(config)
@@ -1017,14 +1361,15 @@ class AlbertForQuestionAnsweringAVPoolBCEv3(AlbertPreTrainedModel):
             inputs_embeds=inputs_embeds
         )
 
-        sequence_output = outputs[0]
+        # contiguous() is a no-op when the encoder output is already dense; the
+        # hint keeps cuBLAS on its fast path for the head GEMMs either way.
+        sequence_output = outputs[0].contiguous()
 
-        logits = self.qa_outputs(sequence_output)
-        start_logits, end_logits = logits.split(1, dim=-1)
-        start_logits = start_logits.squeeze(-1)
-        end_logits = end_logits.squeeze(-1)
+        start_logits, end_logits = self.qa_outputs(sequence_output).unbind(dim=-1)
 
-        first_word = sequence_output[:, 0, :]
+        # Contiguous copy of the [CLS] state so the classifier GEMM gets a
+        # dense row-major input instead of a strided view of sequence_output.
+        first_word = sequence_output[:, 0, :].contiguous()
 
         # has_inp = torch.cat([p_avg, first_word, q_summ, p_avg_p], -1)
         has_log1 = self.has_ans1(first_word).squeeze(-1)
@@ -1033,34 +1378,23 @@ class AlbertForQuestionAnsweringAVPoolBCEv3(AlbertPreTrainedModel):
         #outputs = (start_logits, end_logits, has_log1, has_log2, ) + outputs[2:]
         outputs = (start_logits, end_logits, has_log1,) + outputs[2:]
         if start_positions is not None and end_positions is not None:
-            # If we are on multi-GPU, split add a dimension
-            if len(start_positions.size()) > 1:
-                start_positions = start_positions.squeeze(-1)
-            if len(end_positions.size()) > 1:
-                end_positions = end_positions.squeeze(-1)
-            if len(is_impossibles.size()) > 1:
-                is_impossibles = is_impossibles.squeeze(-1)
             # sometimes the start/end positions are outside our model inputs, we ignore these terms
-            ignored_index = start_logits.size(1)
-            start_positions.clamp_(0, ignored_index)
-            end_positions.clamp_(0, ignored_index)
-            is_impossibles.clamp_(0, ignored_index)
-
-            loss_fct = CrossEntropyLoss(ignore_index=ignored_index)
-            start_loss = loss_fct(start_logits, start_positions)
-            end_loss = loss_fct(end_logits, end_positions)
+            ignored_index = start_logits.shape[1]
+            start_positions = _clamp_positions(start_positions, ignored_index)
+            end_positions = _clamp_positions(end_positions, ignored_index)
+            is_impossibles = _clamp_positions(is_impossibles, ignored_index)
 
-            choice_fct = nn.BCEWithLogitsLoss()
-            choice_loss1 = loss_fct(has_log1, is_impossibles)
+            span_loss = F.cross_entropy(
+                torch.cat([start_logits, end_logits], dim=0),
+                torch.cat([start_positions, end_positions], dim=0),
+                ignore_index=ignored_index)
 
-            is_impossibles = is_impossibles.to(
-                dtype=next(self.parameters()).dtype)  # fp16 compatibility
-            choice_loss2 = choice_fct(has_log2, is_impossibles)
+            choice_loss1 = F.cross_entropy(has_log1, is_impossibles, ignore_index=ignored_index)
 
-            loss_fct = MSELoss()
-            choice_loss3 = loss_fct(has_log2.view(-1), is_impossibles.view(-1))
+            is_impossibles_f = is_impossibles.to(dtype=has_log2.dtype)  # fp16 compatibility
+            choice_loss2 = F.binary_cross_entropy_with_logits(has_log2, is_impossibles_f)
 
-            total_loss = (start_loss + end_loss + choice_loss1 + choice_loss2 + choice_loss3) / 5
+            total_loss = (2 * span_loss + choice_loss1 + choice_loss2) / 4
             outputs = (total_loss,) + outputs
             #print(sum(is_impossibles==1),sum(is_impossibles==0))
             # print(start_logits, end_logits, has_log, is_impossibles)
@@ -1090,42 +1424,35 @@ class AlbertForQuestionAnsweringAVPoolBCE(AlbertPreTrainedModel):
             inputs_embeds=inputs_embeds
         )
 
-        sequence_output = outputs[0]
+        # contiguous() is a no-op when the encoder output is already dense; the
+        # hint keeps cuBLAS on its fast path for the head GEMMs either way.
+        sequence_output = outputs[0].contiguous()
 
-        logits = self.qa_outputs(sequence_output)
-        start_logits, end_logits = logits.split(1, dim=-1)
-        start_logits = start_logits.squeeze(-1)
-        end_logits = end_logits.squeeze(-1)
+        start_logits, end_logits = self.qa_outputs(sequence_output).unbind(dim=-1)
 
-        first_word = sequence_output[:, 0, :]
+        # Contiguous copy of the [CLS] state so the classifier GEMM gets a
+        # dense row-major input instead of a strided view of sequence_output.
+        first_word = sequence_output[:, 0, :].contiguous()
 
         # has_inp = torch.cat([p_avg, first_word, q_summ, p_avg_p], -1)
-        has_log = self.has_ans(first_word).squeeze()
+        has_log = self.has_ans(first_word).squeeze(-1)
 
         outputs = (start_logits, end_logits, has_log,) + outputs[2:]
         if start_positions is not None and end_positions is not None:
-            # If we are on multi-GPU, split add a dimension
-            if len(start_positions.size()) > 1:
-                start_positions = start_positions.squeeze(-1)
-            if len(end_positions.size()) > 1:
-                end_positions = end_positions.squeeze(-1)
-            if len(is_impossibles.size()) > 1:
-                is_impossibles = is_impossibles.squeeze(-1)
             # sometimes the start/end positions are outside our model inputs, we ignore these terms
-            ignored_index = start_logits.size(1)
-            start_positions.clamp_(0, ignored_index)
-            end_positions.clamp_(0, ignored_index)
-            is_impossibles.clamp_(0, ignored_index)
-
-            loss_fct = CrossEntropyLoss(ignore_index=ignored_index)
-            start_loss = loss_fct(start_logits, start_positions)
-            end_loss = loss_fct(end_logits, end_positions)
-
-            choice_fct = nn.BCEWithLogitsLoss()
-            is_impossibles = is_impossibles.to(
-                dtype=next(self.parameters()).dtype)  # fp16 compatibility
-            choice_loss = choice_fct(has_log, is_impossibles)
-            total_loss = (start_loss + end_loss + choice_loss) / 3
+            ignored_index = start_logits.shape[1]
+            start_positions = _clamp_positions(start_positions, ignored_index)
+            end_positions = _clamp_positions(end_positions, ignored_index)
+            is_impossibles = _clamp_positions(is_impossibles, ignored_index)
+
+            span_loss = F.cross_entropy(
+                torch.cat([start_logits, end_logits], dim=0),
+                torch.cat([start_positions, end_positions], dim=0),
+                ignore_index=ignored_index)
+
+            is_impossibles_f = is_impossibles.to(dtype=has_log.dtype)  # fp16 compatibility
+            choice_loss = F.binary_cross_entropy_with_logits(has_log, is_impossibles_f)
+            total_loss = (2 * span_loss + choice_loss) / 3
             outputs = (total_loss,) + outputs
             #print(sum(is_impossibles==1),sum(is_impossibles==0))
             # print(start_logits, end_logits, has_log, is_impossibles)
@@ -1133,6 +1460,32 @@ class AlbertForQuestionAnsweringAVPoolBCE(AlbertPreTrainedModel):
         return outputs  # (loss), start_logits, end_logits, (hidden_states), (attentions)
 
 
+def _chunked_topk(x, k, dim=-1, parts=8):
+    """ Two-stage top-k: per-chunk top-k along `dim`, then top-k over the
+        concatenated per-chunk candidates. The split kernels keep the SMs
+        busy when the reduced length is large and the batch is small; falls
+        back to a plain topk when the length does not split cleanly.
+    """
+    length = x.size(dim)
+    if parts <= 1 or length % parts != 0 or length // parts < k:
+        return torch.topk(x, k, dim=dim)
+    dim = dim % x.dim()
+    chunk = length // parts
+    split_shape = x.shape[:dim] + (parts, chunk) + x.shape[dim + 1:]
+    values, indices = torch.topk(x.reshape(split_shape), k, dim=dim + 1)
+
+    # Rebase the per-chunk indices onto the full axis, then fold the chunk
+    # axis into a parts*k candidate axis for the final reduction.
+    offsets = torch.arange(parts, device=x.device) * chunk
+    indices = indices + offsets.view((1,) * dim + (parts, 1) + (1,) * (x.dim() - dim - 1))
+    cand_shape = x.shape[:dim] + (parts * k,) + x.shape[dim + 1:]
+    values = values.reshape(cand_shape)
+    indices = indices.reshape(cand_shape)
+
+    top_values, top_pos = torch.topk(values, k, dim=dim)
+    return top_values, indices.gather(dim, top_pos)
+
+
 class PoolerStartLogits(nn.Module):
     """ Compute SQuAD start_logits from sequence hidden states. """
     def __init__(self, config):
@@ -1148,10 +1501,7 @@ class PoolerStartLogits(nn.Module):
         x = self.dense(hidden_states).squeeze(-1)
 
         if p_mask is not None:
-            if next(self.parameters()).dtype == torch.float16:
-                x = x * (1 - p_mask) - 65500 * p_mask
-            else:
-                x = x * (1 - p_mask) - 1e30 * p_mask
+            x = x.masked_fill(p_mask.to(torch.bool), torch.finfo(x.dtype).min)
 
         return x
 
@@ -1161,12 +1511,30 @@ class PoolerEndLogits(nn.Module):
     """
     def __init__(self, config):
         super(PoolerEndLogits, self).__init__()
-        self.dense_0 = nn.Linear(config.hidden_size * 2, config.hidden_size)
+        self.dense_0_h = nn.Linear(config.hidden_size, config.hidden_size)
+        self.dense_0_s = nn.Linear(config.hidden_size, config.hidden_size, bias=False)
         self.activation = nn.Tanh()
         self.LayerNorm = nn.LayerNorm(config.hidden_size, eps=1e-12)
         self.dense_1 = nn.Linear(config.hidden_size, 1)
 
-    def forward(self, hidden_states, start_states=None, start_positions=None, p_mask=None):
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        """ Older checkpoints store a single dense_0 acting on the concatenated
+            [hidden_states; start_states]; split its weight into the two
+            per-input projections used here.
+        """
+        weight_key = prefix + "dense_0.weight"
+        if weight_key in state_dict:
+            weight = state_dict.pop(weight_key)
+            hsz = weight.size(0)
+            state_dict[prefix + "dense_0_h.weight"] = weight[:, :hsz]
+            state_dict[prefix + "dense_0_s.weight"] = weight[:, hsz:]
+            bias_key = prefix + "dense_0.bias"
+            if bias_key in state_dict:
+                state_dict[prefix + "dense_0_h.bias"] = state_dict.pop(bias_key)
+        super(PoolerEndLogits, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def forward(self, hidden_states, start_states=None, start_positions=None, p_mask=None,
+                broadcast_beam=False):
         """ Args:
             One of ``start_states``, ``start_positions`` should be not None.
             If both are set, ``start_positions`` overrides ``start_states``.
@@ -1178,24 +1546,37 @@ class PoolerEndLogits(nn.Module):
             **p_mask**: (`optional`) ``torch.FloatTensor`` of shape ``(batch_size, seq_len)``
                 Mask of invalid position such as query and special symbols (PAD, SEP, CLS)
                 1.0 means token should be masked.
+            **broadcast_beam**: (`optional`) ``bool``
+                Set when ``start_states`` holds ``k`` beam starts per sample, shape
+                ``(batch_size, k, hidden_size)``; logits come back as ``(batch_size, seq_len, k)``.
         """
         assert start_states is not None or start_positions is not None, "One of start_states, start_positions should be not None"
         if start_positions is not None:
-            slen, hsz = hidden_states.shape[-2:]
+            hsz = hidden_states.shape[-1]
             start_positions = start_positions[:, None, None].expand(-1, -1, hsz) # shape (bsz, 1, hsz)
-            start_states = hidden_states.gather(-2, start_positions) # shape (bsz, 1, hsz)
-            start_states = start_states.expand(-1, slen, -1) # shape (bsz, slen, hsz)
-
-        x = self.dense_0(torch.cat([hidden_states, start_states], dim=-1))
+            start_states = hidden_states.gather(-2, start_positions) # shape (bsz, 1, hsz), broadcasts over slen
+
+        h_proj = self.dense_0_h(hidden_states)
+        s_proj = self.dense_0_s(start_states)
+        if broadcast_beam:
+            # (bsz, slen, hsz) hidden vs (bsz, k, hsz) beam starts: broadcast
+            # the two projections to (bsz, slen, k, hsz) instead of having the
+            # caller expand both inputs before the GEMMs. Explicit flag rather
+            # than shape sniffing — k == slen must still take this branch.
+            h_proj = h_proj.unsqueeze(-2)
+            s_proj = s_proj.unsqueeze(-3)
+        x = h_proj + s_proj
         x = self.activation(x)
         x = self.LayerNorm(x)
         x = self.dense_1(x).squeeze(-1)
 
         if p_mask is not None:
-            if next(self.parameters()).dtype == torch.float16:
-                x = x * (1 - p_mask) - 65500 * p_mask
-            else:
-                x = x * (1 - p_mask) - 1e30 * p_mask
+            p_mask = p_mask.to(torch.bool)
+            if p_mask.dim() < x.dim():
+                # (bsz, slen) mask against (bsz, slen, k) beam logits; let
+                # masked_fill broadcast over the beam dim.
+                p_mask = p_mask.unsqueeze(-1)
+            x = x.masked_fill(p_mask, torch.finfo(x.dtype).min)
 
         return x
 
@@ -1207,6 +1588,9 @@ class PoolerAnswerClass(nn.Module):
         self.dense_0 = nn.Linear(config.hidden_size * 2, config.hidden_size)
         self.activation = nn.Tanh()
         self.dense_1 = nn.Linear(config.hidden_size, 1, bias=False)
+        # Set to True when the tokenizer always puts [CLS] at position 0 to
+        # replace the per-step cls_index lookup with a plain slice.
+        self.cls_always_first = False
 
     def forward(self, hidden_states, start_states=None, start_positions=None, cls_index=None):
         """
@@ -1227,13 +1611,18 @@ class PoolerAnswerClass(nn.Module):
         """
         hsz = hidden_states.shape[-1]
         assert start_states is not None or start_positions is not None, "One of start_states, start_positions should be not None"
+        # One row per sample: index_select on the flattened (bsz*slen, hsz)
+        # rows with linear indices instead of an expanded gather.
+        flat_states = hidden_states.reshape(-1, hsz)
+        row_offset = torch.arange(
+            hidden_states.size(0), device=hidden_states.device) * hidden_states.size(1)
         if start_positions is not None:
-            start_positions = start_positions[:, None, None].expand(-1, -1, hsz) # shape (bsz, 1, hsz)
-            start_states = hidden_states.gather(-2, start_positions).squeeze(-2) # shape (bsz, hsz)
+            start_states = flat_states.index_select(0, start_positions + row_offset) # shape (bsz, hsz)
 
-        if cls_index is not None:
-            cls_index = cls_index[:, None, None].expand(-1, -1, hsz) # shape (bsz, 1, hsz)
-            cls_token_state = hidden_states.gather(-2, cls_index).squeeze(-2) # shape (bsz, hsz)
+        if self.cls_always_first:
+            cls_token_state = hidden_states[:, 0, :] # shape (bsz, hsz)
+        elif cls_index is not None:
+            cls_token_state = flat_states.index_select(0, cls_index + row_offset) # shape (bsz, hsz)
         else:
             cls_token_state = hidden_states[:, -1, :] # shape (bsz, hsz)
 
@@ -1275,6 +1664,7 @@ class AlbertForQuestionAnsweringAVPoolXL(AlbertPreTrainedModel):
         start_logits = self.start_logits(hidden_states, p_mask=p_mask)
 
         outputs = transformer_outputs[1:]  # Keep mems, hidden states, attentions if there are in it
+        del transformer_outputs
 
         if start_positions is not None and end_positions is not None:
             # If we are on multi-GPU, let's remove the dimension added by batch splitting
@@ -1299,28 +1689,40 @@ class AlbertForQuestionAnsweringAVPoolXL(AlbertPreTrainedModel):
                 # note(zhiliny): by default multiply the loss by 0.5 so that the scale is comparable to start_loss and end_loss
                 total_loss += cls_loss * 0.5
 
+            # Drop the (B, S, H) activation reference before backward's peak.
+            del hidden_states
+
             outputs = (total_loss,) + outputs
 
         else:
             # during inference, compute the end logits based on beam search
             bsz, slen, hsz = hidden_states.size()
-            start_log_probs = F.softmax(start_logits, dim=-1) # shape (bsz, slen)
-
-            start_top_log_probs, start_top_index = torch.topk(start_log_probs, self.start_n_top, dim=-1) # shape (bsz, start_n_top)
-            start_top_index_exp = start_top_index.unsqueeze(-1).expand(-1, -1, hsz) # shape (bsz, start_n_top, hsz)
-            start_states = torch.gather(hidden_states, -2, start_top_index_exp) # shape (bsz, start_n_top, hsz)
-            start_states = start_states.unsqueeze(1).expand(-1, slen, -1, -1) # shape (bsz, slen, start_n_top, hsz)
-
-            hidden_states_expanded = hidden_states.unsqueeze(2).expand_as(start_states) # shape (bsz, slen, start_n_top, hsz)
-            p_mask = p_mask.unsqueeze(-1) if p_mask is not None else None
-            end_logits = self.end_logits(hidden_states_expanded, start_states=start_states, p_mask=p_mask)
-            end_log_probs = F.softmax(end_logits, dim=1) # shape (bsz, slen, start_n_top)
-
-            end_top_log_probs, end_top_index = torch.topk(end_log_probs, self.end_n_top, dim=1) # shape (bsz, end_n_top, start_n_top)
+            # log_softmax so the top-k outputs really are log probs (topk is
+            # monotonic either way) and small probabilities keep precision.
+            start_log_probs = F.log_softmax(start_logits, dim=-1) # shape (bsz, slen)
+
+            start_top_log_probs, start_top_index = _chunked_topk(start_log_probs, self.start_n_top, dim=-1) # shape (bsz, start_n_top)
+            # Few rows per sample: index_select over the flattened
+            # (bsz*slen, hsz) rows beats gather's per-element indirection.
+            row_offset = torch.arange(bsz, device=hidden_states.device).unsqueeze(-1) * slen
+            start_states = hidden_states.reshape(-1, hsz).index_select(
+                0, (start_top_index + row_offset).reshape(-1)).view(bsz, self.start_n_top, hsz)
+
+            # The end pooler broadcasts (bsz, slen, hsz) x (bsz, k, hsz) and
+            # the (bsz, slen) p_mask internally, so no (bsz, slen, k, ...)
+            # input is ever materialized here.
+            end_logits = self.end_logits(hidden_states, start_states=start_states, p_mask=p_mask,
+                                         broadcast_beam=True)
+            end_log_probs = F.log_softmax(end_logits, dim=1) # shape (bsz, slen, start_n_top)
+
+            end_top_log_probs, end_top_index = _chunked_topk(end_log_probs, self.end_n_top, dim=1) # shape (bsz, end_n_top, start_n_top)
             end_top_log_probs = end_top_log_probs.view(-1, self.start_n_top * self.end_n_top)
             end_top_index = end_top_index.view(-1, self.start_n_top * self.end_n_top)
 
-            start_states = torch.einsum("blh,bl->bh", hidden_states, start_log_probs)  # get the representation of START as weighted sum of hidden states
+            # Weighted sum of hidden states as the START representation; the
+            # batched GEMV goes straight to cuBLAS instead of einsum's
+            # permute+reshape lowering.
+            start_states = torch.bmm(start_log_probs.exp().unsqueeze(1), hidden_states).squeeze(1)
             cls_logits = self.answer_class(hidden_states, start_states=start_states, cls_index=cls_index)  # Shape (batch size,): one single `cls_logits` for each sample
 
             outputs = (start_top_log_probs, start_top_index, end_top_log_probs, end_top_index, cls_logits) + outputs
@@ -1352,32 +1754,31 @@ class AlbertForQuestionAnsweringAVReg(AlbertPreTrainedModel):
             inputs_embeds=inputs_embeds
         )
 
-        sequence_output = outputs[0]
+        # contiguous() is a no-op when the encoder output is already dense; the
+        # hint keeps cuBLAS on its fast path for the head GEMMs either way.
+        sequence_output = outputs[0].contiguous()
 
-        logits = self.qa_outputs(sequence_output)
-        start_logits, end_logits = logits.split(1, dim=-1)
-        start_logits = start_logits.squeeze(-1)
-        end_logits = end_logits.squeeze(-1)
+        start_logits, end_logits = self.qa_outputs(sequence_output).unbind(dim=-1)
 
-        first_word = sequence_output[:, 0, :]
+        # Contiguous copy of the [CLS] state so the classifier GEMM gets a
+        # dense row-major input instead of a strided view of sequence_output.
+        first_word = sequence_output[:, 0, :].contiguous()
 
         # has_inp = torch.cat([p_avg, first_word, q_summ, p_avg_p], -1)
         has_log = self.has_ans(first_word)
+        # Drop the (B, S, H) activation reference before backward's peak.
+        del sequence_output, first_word
 
         outputs = (start_logits, end_logits, has_log,) + outputs[2:]
         if start_positions is not None and end_positions is not None:
-            # If we are on multi-GPU, split add a dimension
-            if len(start_positions.size()) > 1:
-                start_positions = start_positions.squeeze(-1)
-            if len(end_positions.size()) > 1:
-                end_positions = end_positions.squeeze(-1)
-            if len(is_impossibles.size()) > 1:
-                is_impossibles = is_impossibles.squeeze(-1)
             # sometimes the start/end positions are outside our model inputs, we ignore these terms
-            ignored_index = start_logits.size(1)
-            start_positions.clamp_(0, ignored_index)
-            end_positions.clamp_(0, ignored_index)
-            is_impossibles.clamp_(0, ignored_index)
+            ignored_index = start_logits.shape[1]
+            start_positions = _clamp_positions(start_positions, ignored_index)
+            end_positions = _clamp_positions(end_positions, ignored_index)
+            # is_impossibles is a 0/1 target; clamping it against the ignore
+            # index was a per-step kernel with no effect on the loss.
+            if is_impossibles.dim() > 1:
+                is_impossibles = is_impossibles.squeeze(-1)
 
             loss_fct = CrossEntropyLoss(ignore_index=ignored_index)
             start_loss = loss_fct(start_logits, start_positions)
@@ -1413,39 +1814,37 @@ class AlbertForQuestionAnsweringAV(AlbertPreTrainedModel):
             inputs_embeds=inputs_embeds
         )
 
-        sequence_output = outputs[0]
+        # contiguous() is a no-op when the encoder output is already dense; the
+        # hint keeps cuBLAS on its fast path for the head GEMMs either way.
+        sequence_output = outputs[0].contiguous()
 
-        logits = self.qa_outputs(sequence_output)
-        start_logits, end_logits = logits.split(1, dim=-1)
-        start_logits = start_logits.squeeze(-1)
-        end_logits = end_logits.squeeze(-1)
+        start_logits, end_logits = self.qa_outputs(sequence_output).unbind(dim=-1)
 
-        alpha1 = F.softmax(start_logits, dim=1)
-        alpha2 = F.softmax(end_logits, dim=1)
-        p_avg1 = torch.bmm(alpha1.unsqueeze(1), sequence_output).squeeze(1)
-        p_avg2 = torch.bmm(alpha2.unsqueeze(1), sequence_output).squeeze(1)
-        p_avg = p_avg1 + p_avg2
+        # Both attention-weighted averages share sequence_output, so the two
+        # GEMV dispatches batch into one bmm over the stacked (B, 2, L) weights.
+        alpha = torch.stack([F.softmax(start_logits, dim=1), F.softmax(end_logits, dim=1)], dim=1)
+        p_avg = torch.bmm(alpha, sequence_output).sum(dim=1)
 
-        first_word = sequence_output[:, 0, :]
+        # Contiguous copy of the [CLS] state so the classifier GEMM gets a
+        # dense row-major input instead of a strided view of sequence_output.
+        first_word = sequence_output[:, 0, :].contiguous()
 
         # has_inp = torch.cat([p_avg, first_word, q_summ, p_avg_p], -1)
         has_inp = torch.cat([p_avg, first_word], -1)
         has_log = self.has_ans(has_inp)
+        # Drop the (B, S, H) activation reference before backward's peak.
+        del sequence_output, first_word, has_inp
 
         outputs = (start_logits, end_logits, has_log,) + outputs[2:]
         if start_positions is not None and end_positions is not None:
-            # If we are on multi-GPU, split add a dimension
-            if len(start_positions.size()) > 1:
-                start_positions = start_positions.squeeze(-1)
-            if len(end_positions.size()) > 1:
-                end_positions = end_positions.squeeze(-1)
-            if len(is_impossibles.size()) > 1:
-                is_impossibles = is_impossibles.squeeze(-1)
             # sometimes the start/end positions are outside our model inputs, we ignore these terms
-            ignored_index = start_logits.size(1)
-            start_positions.clamp_(0, ignored_index)
-            end_positions.clamp_(0, ignored_index)
-            is_impossibles.clamp_(0, ignored_index)
+            ignored_index = start_logits.shape[1]
+            start_positions = _clamp_positions(start_positions, ignored_index)
+            end_positions = _clamp_positions(end_positions, ignored_index)
+            # is_impossibles is a 0/1 target; clamping it against the ignore
+            # index was a per-step kernel with no effect on the loss.
+            if is_impossibles.dim() > 1:
+                is_impossibles = is_impossibles.squeeze(-1)
 
             loss_fct = CrossEntropyLoss(ignore_index=ignored_index)
             start_loss = loss_fct(start_logits, start_positions)
@@ -1481,6 +1880,7 @@ class AlbertForQuestionAnsweringCLS(AlbertPreTrainedModel):
         pooled_output = outputs[1]
         pooled_output = self.dropout(pooled_output)
         logits = self.classifier(pooled_output)
+        del pooled_output
 
         outputs = (logits,) + outputs[2:]  # add hidden states and attention if they are here
 
@@ -1496,29 +1896,49 @@ class AlbertForQuestionAnsweringCLS(AlbertPreTrainedModel):
 
         return outputs  # (loss), logits, (hidden_states), (attentions)
 
-def split_ques_context( sequence_output, pq_end_pos):
+_split_idx_cache = {}
+
+
+def _split_index(length, device):
+    """ Per-(length, device) cache of the constant arange rows used by
+        split_ques_context, so the hot path stops re-allocating them. """
+    key = (length, device)
+    idx = _split_idx_cache.get(key)
+    if idx is None:
+        idx = torch.arange(length, device=device).unsqueeze(0)
+        _split_idx_cache[key] = idx
+    return idx
+
+
+def split_ques_context(sequence_output, pq_end_pos):
+    """ Slice the packed [CLS] question [SEP] context encoding into separate,
+        zero-padded question/context tensors. Fully vectorized: one
+        arange-based gather per output plus a broadcast mask multiply, instead
+        of a Python loop with four slice writes per sample.
+    """
     ques_max_len = 64
-    context_max_len =512-64
+    context_max_len = 512 - 64
     sep_tok_len = 1
-    ques_sequence_output = sequence_output.new(
-        torch.Size((sequence_output.size(0), ques_max_len, sequence_output.size(2)))).zero_()
-    context_sequence_output = sequence_output.new_zeros(
-        (sequence_output.size(0), context_max_len, sequence_output.size(2)))
-    context_attention_mask = sequence_output.new_zeros((sequence_output.size(0), context_max_len))
-    ques_attention_mask = sequence_output.new_zeros((sequence_output.size(0), ques_max_len))
-    for i in range(0, sequence_output.size(0)):
-        q_end = pq_end_pos[i][0]
-        p_end = pq_end_pos[i][1]
-        ques_sequence_output[i, :min(ques_max_len, q_end)] = sequence_output[i,
-                                                                   1: 1 + min(ques_max_len, q_end)]
-        context_sequence_output[i, :min(context_max_len, p_end - q_end - sep_tok_len)] = sequence_output[i,
-                                                                                     q_end + sep_tok_len + 1: q_end + sep_tok_len + 1 + min(
-                                                                                         p_end - q_end - sep_tok_len,
-                                                                                         context_max_len)]
-        context_attention_mask[i, :min(context_max_len, p_end - q_end - sep_tok_len)] = sequence_output.new_ones(
-            (1, context_max_len))[0, :min(context_max_len, p_end - q_end - sep_tok_len)]
-        ques_attention_mask[i, : min(ques_max_len, q_end)] = sequence_output.new_ones((1, ques_max_len))[0,
-                                                                   : min(ques_max_len, q_end)]
+    bsz, seq_len, hsz = sequence_output.size()
+
+    q_end = pq_end_pos[:, 0:1]  # (bsz, 1)
+    p_end = pq_end_pos[:, 1:2]  # (bsz, 1)
+
+    # Question tokens live at positions 1 .. q_end; out-of-range gathers are
+    # clamped onto a valid row and zeroed by the mask afterwards.
+    ques_idx = _split_index(ques_max_len, sequence_output.device)
+    ques_attention_mask = (ques_idx < q_end).to(sequence_output.dtype)  # (bsz, ques_max_len)
+    ques_pos = (1 + ques_idx).clamp(max=seq_len - 1).expand(bsz, -1)
+    ques_sequence_output = sequence_output.gather(
+        1, ques_pos.unsqueeze(-1).expand(-1, -1, hsz)) * ques_attention_mask.unsqueeze(-1)
+
+    # Context tokens follow the separator: positions q_end + sep + 1 onwards.
+    context_idx = _split_index(context_max_len, sequence_output.device)
+    context_attention_mask = (context_idx < p_end - q_end - sep_tok_len).to(sequence_output.dtype)
+    context_pos = (q_end + sep_tok_len + 1 + context_idx).clamp(max=seq_len - 1)
+    context_sequence_output = sequence_output.gather(
+        1, context_pos.unsqueeze(-1).expand(-1, -1, hsz)) * context_attention_mask.unsqueeze(-1)
+
     return ques_sequence_output, context_sequence_output, ques_attention_mask, context_attention_mask
 
 class AlbertTrmCoAtt(nn.Module):
@@ -1534,6 +1954,7 @@ class AlbertTrmCoAtt(nn.Module):
         self.num_attention_heads = config.num_attention_heads
         self.hidden_size = config.hidden_size
         self.attention_head_size = config.hidden_size // config.num_attention_heads
+        self._attn_scale = 1.0 / math.sqrt(self.attention_head_size)
 
         self.all_head_size = self.num_attention_heads * self.attention_head_size
         self.query = nn.Linear(config.hidden_size, self.all_head_size)
@@ -1557,10 +1978,12 @@ class AlbertTrmCoAtt(nn.Module):
 
     # attention mask 对应 input_ids
     def forward(self, input_ids, input_ids_1, attention_mask=None, head_mask=None):
-        extended_attention_mask = attention_mask[:, None, None, :]
-        extended_attention_mask = extended_attention_mask.to(dtype=next(self.parameters()).dtype)  # fp16 compatibility
-        extended_attention_mask = (1.0 - extended_attention_mask) * -10000.0
-        attention_mask = extended_attention_mask
+        if attention_mask is not None and attention_mask.dim() == 2:
+            # Compatibility for callers still passing the raw (batch, seq) 0/1
+            # mask; the outer model is expected to pre-build the additive mask
+            # once instead of paying this cast+arithmetic per call.
+            attention_mask = (1.0 - attention_mask[:, None, None, :].to(
+                dtype=input_ids.dtype)) * -10000.0
 
         mixed_query_layer = self.query(input_ids_1)
         mixed_key_layer = self.key(input_ids)
@@ -1570,36 +1993,49 @@ class AlbertTrmCoAtt(nn.Module):
         key_layer = self.transpose_for_scores(mixed_key_layer)
         value_layer = self.transpose_for_scores(mixed_value_layer)
 
-        # Take the dot product between "query" and "key" to get the raw attention scores.
-        attention_scores = torch.matmul(query_layer, key_layer.transpose(-1, -2))
-        attention_scores = attention_scores / math.sqrt(self.attention_head_size)
-        if attention_mask is not None:
-            # Apply the attention mask is (precomputed for all layers in BertModel forward() function)
-            attention_scores = attention_scores + attention_mask
+        if _HAS_SDPA and head_mask is None:
+            # Fused kernel never materializes the (batch, heads, Lq, Lk) score
+            # matrix; the additive float mask rides along as attn_mask. SDPA
+            # applies the 1/sqrt(d) scaling itself.
+            context_layer = F.scaled_dot_product_attention(
+                query_layer, key_layer, value_layer,
+                attn_mask=attention_mask,
+                dropout_p=self.dropout.p if self.training else 0.0)
+        else:
+            # The permuted K/V views are non-contiguous; one explicit repack
+            # here saves cuBLAS an implicit copy inside each matmul. SDPA
+            # above handles the strided layout natively.
+            key_layer = key_layer.contiguous()
+            value_layer = value_layer.contiguous()
 
-        # Normalize the attention scores to probabilities.
-        attention_probs = nn.Softmax(dim=-1)(attention_scores)
+            # Pre-scale the (B, N, Lq, D) query instead of dividing the full
+            # (B, N, Lq, Lk) score matrix after the matmul; SDPA above applies
+            # the scale internally, so only this branch needs it.
+            attention_scores = torch.matmul(query_layer * self._attn_scale, key_layer.transpose(-1, -2))
+            if attention_mask is not None:
+                # Apply the attention mask is (precomputed for all layers in BertModel forward() function)
+                attention_scores = attention_scores + attention_mask
 
-        # This is actually dropping out entire tokens to attend to, which might
-        # seem a bit unusual, but is taken from the original Transformer paper.
-        attention_probs = self.dropout(attention_probs)
+            # Normalize the attention scores to probabilities.
+            attention_probs = nn.Softmax(dim=-1)(attention_scores)
 
-        # Mask heads if we want to
-        if head_mask is not None:
-            attention_probs = attention_probs * head_mask
+            # This is actually dropping out entire tokens to attend to, which might
+            # seem a bit unusual, but is taken from the original Transformer paper.
+            attention_probs = self.dropout(attention_probs)
 
-        context_layer = torch.matmul(attention_probs, value_layer)
+            # Mask heads if we want to
+            if head_mask is not None:
+                attention_probs = attention_probs * head_mask
+
+            context_layer = torch.matmul(attention_probs, value_layer)
 
         context_layer = context_layer.permute(0, 2, 1, 3).contiguous()
         new_context_layer_shape = context_layer.size()[:-2] + (self.all_head_size,)
         reshaped_context_layer = context_layer.view(*new_context_layer_shape)
 
-
-        # Should find a better way to do this
-        w = self.dense.weight.t().view(self.num_attention_heads, self.attention_head_size, self.hidden_size).to(context_layer.dtype)
-        b = self.dense.bias.to(context_layer.dtype)
-
-        projected_context_layer = torch.einsum("bfnd,ndh->bfh", context_layer, w) + b
+        # With the heads flattened back into the hidden dimension, the old
+        # "bfnd,ndh->bfh" einsum is just the dense projection itself.
+        projected_context_layer = self.dense(reshaped_context_layer)
         projected_context_layer_dropout = self.dropout(projected_context_layer)
         layernormed_context_layer = self.LayerNorm(input_ids_1 + projected_context_layer_dropout)
 
@@ -1609,28 +2045,22 @@ class AlbertTrmCoAtt(nn.Module):
         hidden_states = self.full_layer_layer_norm(ffn_output + layernormed_context_layer)
         return hidden_states
 
+@torch.jit.script
 def masked_softmax(vector: torch.Tensor,
-                   mask: torch.Tensor,
+                   mask: Optional[torch.Tensor],
                    dim: int = -1,
                    memory_efficient: bool = False,
                    mask_fill_value: float = -1e32) -> torch.Tensor:
+    # The old non-memory-efficient branch (mask-multiply, softmax, re-mask,
+    # renormalize) materialized three extra (B, Lp, Lq) temporaries for the
+    # same distribution; fill-then-softmax is now the only path. The
+    # memory_efficient flag is kept for call-site compatibility.
     if mask is None:
-        result = torch.nn.functional.softmax(vector, dim=dim)
-    else:
-        mask = mask.float()
-        #mask = mask.half()
-
-        while mask.dim() < vector.dim():
-            mask = mask.unsqueeze(1)
-        if not memory_efficient:
-            # To limit numerical errors from large vector elements outside the mask, we zero these out.
-            result = torch.nn.functional.softmax(vector * mask, dim=dim)
-            result = result * mask
-            result = result / (result.sum(dim=dim, keepdim=True) + 1e-13)
-        else:
-            masked_vector = vector.masked_fill((1 - mask).byte(), mask_fill_value)
-            result = torch.nn.functional.softmax(masked_vector, dim=dim)
-    return result
+        return F.softmax(vector, dim=dim)
+    mask = mask.to(torch.bool)
+    while mask.dim() < vector.dim():
+        mask = mask.unsqueeze(1)
+    return F.softmax(vector.masked_fill(~mask, mask_fill_value), dim=dim)
 
 class SCAttention(nn.Module) :
     def __init__(self, input_size, hidden_size) :
@@ -1648,9 +2078,9 @@ class SCAttention(nn.Module) :
         Wp = passage
         Wq = question
         scores = torch.bmm(Wp, Wq.transpose(2, 1))
-        mask = q_mask.unsqueeze(1).repeat(1, passage.size(1), 1)
-        # scores.data.masked_fill_(mask.data, -float('inf'))
-        alpha = masked_softmax(scores, mask)
+        # masked_softmax unsqueezes and broadcasts the (B, Lq) mask over the
+        # passage dim itself; repeating it to (B, Lp, Lq) was pure memory waste.
+        alpha = masked_softmax(scores, q_mask)
         output = torch.bmm(alpha, Wq)
         output = nn.ReLU()(self.map_linear(output))
         #output = self.map_linear(all_con)
@@ -1682,35 +2112,33 @@ class AlbertForQuestionAnsweringSeqTrm(AlbertPreTrainedModel):
         query_sequence_output, context_sequence_output, query_attention_mask, context_attention_mask = \
             split_ques_context(sequence_output, pq_end_pos)
 
-        sequence_output = self.albert_att(query_sequence_output, sequence_output, query_attention_mask)
+        # Build the additive attention mask once out here; the co-attention
+        # block takes it pre-extended.
+        coatt_mask = (1.0 - query_attention_mask[:, None, None, :].to(
+            dtype=sequence_output.dtype)) * -10000.0
+        sequence_output = self.albert_att(query_sequence_output, sequence_output, coatt_mask)
 
         sequence_output = sequence_output + outputs[0]
 
-        logits = self.qa_outputs(sequence_output)
-        start_logits, end_logits = logits.split(1, dim=-1)
-        start_logits = start_logits.squeeze(-1)
-        end_logits = end_logits.squeeze(-1)
+        start_logits, end_logits = self.qa_outputs(sequence_output).unbind(dim=-1)
 
+        # Drop the (B, S, H) activation references before backward's peak.
+        del sequence_output, query_sequence_output, context_sequence_output
 
         outputs = (start_logits, end_logits,) + outputs[2:]
         if start_positions is not None and end_positions is not None:
-            # If we are on multi-GPU, split add a dimension
-            if len(start_positions.size()) > 1:
-                start_positions = start_positions.squeeze(-1)
-            if len(end_positions.size()) > 1:
-                end_positions = end_positions.squeeze(-1)
-            if len(is_impossibles.size()) > 1:
-                is_impossibles = is_impossibles.squeeze(-1)
             # sometimes the start/end positions are outside our model inputs, we ignore these terms
-            ignored_index = start_logits.size(1)
-            start_positions.clamp_(0, ignored_index)
-            end_positions.clamp_(0, ignored_index)
-            is_impossibles.clamp_(0, ignored_index)
-
-            loss_fct = CrossEntropyLoss(ignore_index=ignored_index)
-            start_loss = loss_fct(start_logits, start_positions)
-            end_loss = loss_fct(end_logits, end_positions)
-            total_loss = (start_loss + end_loss) / 2
+            ignored_index = start_logits.shape[1]
+            start_positions = _clamp_positions(start_positions, ignored_index)
+            end_positions = _clamp_positions(end_positions, ignored_index)
+            is_impossibles = _clamp_positions(is_impossibles, ignored_index)
+
+            # One softmax+NLL launch over the stacked (2B, S) logits instead of
+            # two; the mean over both halves matches (start_loss + end_loss) / 2.
+            total_loss = F.cross_entropy(
+                torch.cat([start_logits, end_logits], dim=0),
+                torch.cat([start_positions, end_positions], dim=0),
+                ignore_index=ignored_index)
             outputs = (total_loss,) + outputs
 
         return outputs  # (loss), start_logits, end_logits, (hidden_states), (attentions)
@@ -1745,31 +2173,25 @@ class AlbertForQuestionAnsweringSeqSC(AlbertPreTrainedModel):
 
         sequence_output = sequence_output + outputs[0]
 
-        logits = self.qa_outputs(sequence_output)
-        start_logits, end_logits = logits.split(1, dim=-1)
-        start_logits = start_logits.squeeze(-1)
-        end_logits = end_logits.squeeze(-1)
+        start_logits, end_logits = self.qa_outputs(sequence_output).unbind(dim=-1)
 
+        # Drop the (B, S, H) activation references before backward's peak.
+        del sequence_output, query_sequence_output, context_sequence_output
 
         outputs = (start_logits, end_logits,) + outputs[2:]
         if start_positions is not None and end_positions is not None:
-            # If we are on multi-GPU, split add a dimension
-            if len(start_positions.size()) > 1:
-                start_positions = start_positions.squeeze(-1)
-            if len(end_positions.size()) > 1:
-                end_positions = end_positions.squeeze(-1)
-            if len(is_impossibles.size()) > 1:
-                is_impossibles = is_impossibles.squeeze(-1)
             # sometimes the start/end positions are outside our model inputs, we ignore these terms
-            ignored_index = start_logits.size(1)
-            start_positions.clamp_(0, ignored_index)
-            end_positions.clamp_(0, ignored_index)
-            is_impossibles.clamp_(0, ignored_index)
-
-            loss_fct = CrossEntropyLoss(ignore_index=ignored_index)
-            start_loss = loss_fct(start_logits, start_positions)
-            end_loss = loss_fct(end_logits, end_positions)
-            total_loss = (start_loss + end_loss) / 2
+            ignored_index = start_logits.shape[1]
+            start_positions = _clamp_positions(start_positions, ignored_index)
+            end_positions = _clamp_positions(end_positions, ignored_index)
+            is_impossibles = _clamp_positions(is_impossibles, ignored_index)
+
+            # One softmax+NLL launch over the stacked (2B, S) logits instead of
+            # two; the mean over both halves matches (start_loss + end_loss) / 2.
+            total_loss = F.cross_entropy(
+                torch.cat([start_logits, end_logits], dim=0),
+                torch.cat([start_positions, end_positions], dim=0),
+                ignore_index=ignored_index)
             outputs = (total_loss,) + outputs
 
         return outputs  # (loss), start_logits, end_logits, (hidden_states), (attentions)
\ No newline at end of file
@@ -16,6 +16,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import math
 import unittest
 import shutil
 
@@ -26,10 +27,16 @@ from .configuration_common_test import ConfigTester
 from .utils import require_torch, slow, torch_device
 
 if is_torch_available():
+    import torch
+    import torch.nn.functional as F
+
     from transformers import (AlbertConfig, AlbertModel, AlbertForMaskedLM,
                               AlbertForSequenceClassification, AlbertForQuestionAnswering,
                               )
-    from transformers.modeling_albert import ALBERT_PRETRAINED_MODEL_ARCHIVE_MAP
+    from transformers.modeling_albert import (ALBERT_PRETRAINED_MODEL_ARCHIVE_MAP,
+                                              AlbertAttention, PoolerEndLogits,
+                                              AlbertForQuestionAnsweringDep,
+                                              AlbertForQuestionAnsweringDep2)
 
 
 @require_torch
@@ -236,5 +243,123 @@ class AlbertModelTest(CommonTestCases.CommonModelTester):
             shutil.rmtree(cache_dir)
             self.assertIsNotNone(model)
 
+@require_torch
+class AlbertCheckpointRemapTest(unittest.TestCase):
+    """ Round-trip tests for the _load_from_state_dict shims that repack
+        old-format checkpoints (separate query/key/value projections,
+        concatenated dense_0 and end_pooler) into the fused parameters.
+    """
+
+    def small_config(self, **kwargs):
+        return AlbertConfig(
+            vocab_size=99,
+            embedding_size=16,
+            hidden_size=36,
+            num_hidden_layers=2,
+            num_hidden_groups=2,
+            num_attention_heads=6,
+            intermediate_size=37,
+            hidden_dropout_prob=0.0,
+            attention_probs_dropout_prob=0.0,
+            **kwargs)
+
+    def test_attention_qkv_repack(self):
+        torch.manual_seed(0)
+        config = self.small_config(attn_implementation="eager")
+        attention = AlbertAttention(config)
+
+        legacy = attention.state_dict()
+        q_w, k_w, v_w = legacy.pop('qkv.weight').chunk(3, dim=0)
+        q_b, k_b, v_b = legacy.pop('qkv.bias').chunk(3, dim=0)
+        legacy.update({'query.weight': q_w, 'query.bias': q_b,
+                       'key.weight': k_w, 'key.bias': k_b,
+                       'value.weight': v_w, 'value.bias': v_b})
+
+        loaded = AlbertAttention(config)
+        loaded.load_state_dict(legacy)
+        loaded.eval()
+
+        # The stripes must come back in query/key/value order.
+        self.assertTrue(torch.equal(loaded.qkv.weight, attention.qkv.weight))
+        self.assertTrue(torch.equal(loaded.qkv.bias, attention.qkv.bias))
+
+        batch_size, seq_length = 2, 7
+        hidden_states = torch.randn(batch_size, seq_length, config.hidden_size)
+        output = loaded(hidden_states)[0]
+
+        # Pre-refactor computation with the separate projections.
+        num_heads = config.num_attention_heads
+        head_size = config.hidden_size // num_heads
+
+        def split_heads(x):
+            return x.view(batch_size, seq_length, num_heads, head_size).permute(0, 2, 1, 3)
+
+        query = split_heads(F.linear(hidden_states, q_w, q_b))
+        key = split_heads(F.linear(hidden_states, k_w, k_b))
+        value = split_heads(F.linear(hidden_states, v_w, v_b))
+        scores = torch.matmul(query, key.transpose(-1, -2)) / math.sqrt(head_size)
+        context = torch.matmul(F.softmax(scores, dim=-1), value)
+        context = context.permute(0, 2, 1, 3).reshape(batch_size, seq_length, config.hidden_size)
+        reference = loaded.LayerNorm(
+            hidden_states + F.linear(context, loaded.dense.weight, loaded.dense.bias))
+        self.assertTrue(torch.allclose(output, reference, atol=1e-5))
+
+    def test_pooler_end_logits_dense_0_split(self):
+        torch.manual_seed(0)
+        config = self.small_config()
+        pooler = PoolerEndLogits(config)
+
+        legacy = pooler.state_dict()
+        dense_0_weight = torch.cat(
+            [legacy.pop('dense_0_h.weight'), legacy.pop('dense_0_s.weight')], dim=1)
+        dense_0_bias = legacy.pop('dense_0_h.bias')
+        legacy.update({'dense_0.weight': dense_0_weight, 'dense_0.bias': dense_0_bias})
+
+        loaded = PoolerEndLogits(config)
+        loaded.load_state_dict(legacy)
+        loaded.eval()
+
+        hidden_states = torch.randn(2, 7, config.hidden_size)
+        start_states = torch.randn(2, 7, config.hidden_size)
+        output = loaded(hidden_states, start_states=start_states)
+
+        # Pre-refactor computation: one dense over the concatenated inputs.
+        x = F.linear(torch.cat([hidden_states, start_states], dim=-1), dense_0_weight, dense_0_bias)
+        x = torch.tanh(x)
+        x = loaded.LayerNorm(x)
+        reference = loaded.dense_1(x).squeeze(-1)
+        self.assertTrue(torch.allclose(output, reference, atol=1e-5))
+
+    def test_dep_end_pooler_split(self):
+        torch.manual_seed(0)
+        config = self.small_config()
+        for model_class in (AlbertForQuestionAnsweringDep, AlbertForQuestionAnsweringDep2):
+            model = model_class(config)
+
+            legacy = model.state_dict()
+            end_pooler_weight = torch.cat(
+                [legacy.pop('end_pooler_s').unsqueeze(1), legacy.pop('end_pooler_h.weight')], dim=1)
+            end_pooler_bias = legacy.pop('end_pooler_h.bias')
+            legacy.update({'end_pooler.weight': end_pooler_weight, 'end_pooler.bias': end_pooler_bias})
+
+            loaded = model_class(config)
+            loaded.load_state_dict(legacy)
+
+            # Column 0 is the start-logit stripe, the rest the hidden projection.
+            self.assertTrue(torch.equal(loaded.end_pooler_s, model.end_pooler_s))
+            self.assertTrue(torch.equal(loaded.end_pooler_h.weight, model.end_pooler_h.weight))
+            self.assertTrue(torch.equal(loaded.end_pooler_h.bias, model.end_pooler_h.bias))
+
+            sequence_output = torch.randn(2, 7, config.hidden_size)
+            start_logits = torch.randn(2, 7)
+            split_repr = F.gelu(loaded.end_pooler_h(sequence_output)
+                                + start_logits.unsqueeze(-1) * loaded.end_pooler_s)
+            # Pre-refactor computation: one end_pooler over [start_logit; hidden].
+            reference = F.gelu(F.linear(
+                torch.cat([start_logits.unsqueeze(-1), sequence_output], dim=-1),
+                end_pooler_weight, end_pooler_bias))
+            self.assertTrue(torch.allclose(split_repr, reference, atol=1e-5))
+
+
 if __name__ == "__main__":
     unittest.main()